@@ -0,0 +1,377 @@
+"""Бенчмарк декодирования QR-кодов.
+
+Запуск:
+    python benchmark_qr.py                          # синтетический корпус
+    python benchmark_qr.py путь/к/корпусу           # свои фото
+    python benchmark_qr.py --json results.json      # сохранить результаты
+    python benchmark_qr.py --compare results.json   # сравнить с прошлым прогоном
+
+Синтетический корпус создается через create_qr_code и портится так же,
+как фото у входа: размытие, пережатие JPEG, перспектива, блики, темнота,
+мелкий масштаб и муар экрана.
+
+Свой корпус - папка с фото. Подпапка задает класс искажения, ожидаемые
+данные берутся из имени файла (например, blur/12U123456789_3.jpg);
+если их нет, попаданием считается любой распознанный код.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import tempfile
+import time
+import cv2
+import numpy as np
+from qr_utils import (DECODER_BACKENDS, QR_DECODER_BACKENDS, get_available_backends,
+                      decode_with_backend, decode_with_filters, create_qr_code,
+                      decode_qr_code_from_photo, enhanced_qr_decode,
+                      decode_qr_payload, decode_qr_payloads)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+PAYLOAD_RE = re.compile(r'\d+U\d+')
+CANVAS_SIZE = 640
+
+
+# ========== СИНТЕТИЧЕСКИЙ КОРПУС ==========
+def render_qr(event_number, user_id):
+    """QR-код проекта в виде BGR-массива"""
+    bio, qr_data = create_qr_code(event_number, user_id)
+    img = cv2.imdecode(np.frombuffer(bio.getvalue(), np.uint8), cv2.IMREAD_COLOR)
+    return img, qr_data
+
+
+def noisy_background(rng, shape):
+    """Серый фон с шумом, как на фото экрана телефона"""
+    background = np.full(shape, rng.randint(150, 210), np.float32)
+    noise = np.random.default_rng(rng.randint(0, 2 ** 31)).normal(0, 6, shape)
+    return np.clip(background + noise, 0, 255).astype(np.uint8)
+
+
+def place_on_canvas(qr_img, rng):
+    """Кладет QR-код в случайное место кадра"""
+    canvas = noisy_background(rng, (CANVAS_SIZE, CANVAS_SIZE, 3))
+
+    side = rng.randint(300, 440)
+    qr_img = cv2.resize(qr_img, (side, side), interpolation=cv2.INTER_AREA)
+
+    x = rng.randint(0, CANVAS_SIZE - side)
+    y = rng.randint(0, CANVAS_SIZE - side)
+    canvas[y:y + side, x:x + side] = qr_img
+    return canvas
+
+
+def degrade_clean(img, rng):
+    return img
+
+
+def degrade_blur(img, rng):
+    kernel = rng.choice([5, 7, 9, 11])
+    return cv2.GaussianBlur(img, (kernel, kernel), 0)
+
+
+def degrade_jpeg(img, rng):
+    ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, rng.randint(8, 25)])
+    return cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+
+
+def degrade_perspective(img, rng):
+    h, w = img.shape[:2]
+    shift = 0.18 * w
+    src = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    dst = np.float32([[x + rng.uniform(-shift, shift), y + rng.uniform(-shift, shift)]
+                      for x, y in src])
+    matrix = cv2.getPerspectiveTransform(src, dst)
+    return cv2.warpPerspective(img, matrix, (w, h), borderMode=cv2.BORDER_REPLICATE)
+
+
+def degrade_glare(img, rng):
+    h, w = img.shape[:2]
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    cx, cy = rng.uniform(0.3, 0.7) * w, rng.uniform(0.3, 0.7) * h
+    radius = rng.uniform(0.12, 0.25) * w
+    mask = np.exp(-((xx - cx) ** 2 + (yy - cy) ** 2) / (2 * radius ** 2))
+    strength = rng.uniform(0.6, 0.9)
+    glare = img.astype(np.float32) + (255 - img.astype(np.float32)) * (mask * strength)[..., None]
+    return np.clip(glare, 0, 255).astype(np.uint8)
+
+
+def degrade_low_light(img, rng):
+    dark = img.astype(np.float32) * rng.uniform(0.15, 0.3)
+    noise = np.random.default_rng(rng.randint(0, 2 ** 31)).normal(0, 5, img.shape)
+    return np.clip(dark + noise, 0, 255).astype(np.uint8)
+
+
+def degrade_small_scale(img, rng):
+    # Код снят издалека и занимает ~70-120 px кадра
+    h, w = img.shape[:2]
+    scale = rng.uniform(0.2, 0.3)
+    small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    canvas = noisy_background(rng, img.shape)
+    x = rng.randint(0, w - small.shape[1])
+    y = rng.randint(0, h - small.shape[0])
+    canvas[y:y + small.shape[0], x:x + small.shape[1]] = small
+    return canvas
+
+
+def degrade_moire(img, rng):
+    h, w = img.shape[:2]
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    period = rng.uniform(2.5, 4.5)
+    angle = rng.uniform(0, np.pi)
+    wave = np.sin(2 * np.pi * (xx * np.cos(angle) + yy * np.sin(angle)) / period)
+    pattern = 0.8 + 0.2 * wave
+    moire = np.clip(img.astype(np.float32) * pattern[..., None], 0, 255).astype(np.uint8)
+    scale = rng.uniform(0.8, 0.95)
+    moire = cv2.resize(moire, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+    return cv2.resize(moire, (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+DEGRADATIONS = {
+    'clean': degrade_clean,
+    'blur': degrade_blur,
+    'jpeg': degrade_jpeg,
+    'perspective': degrade_perspective,
+    'glare': degrade_glare,
+    'low_light': degrade_low_light,
+    'small_scale': degrade_small_scale,
+    'moire': degrade_moire,
+}
+
+
+def generate_corpus(output_dir, samples, seed):
+    """Создает синтетический корпус: папка на каждый класс искажения"""
+    rng = random.Random(seed)
+
+    for degradation, degrade in DEGRADATIONS.items():
+        class_dir = os.path.join(output_dir, degradation)
+        os.makedirs(class_dir, exist_ok=True)
+
+        for index in range(samples):
+            qr_img, qr_data = render_qr(rng.randint(1, 500), rng.randint(10 ** 8, 10 ** 10))
+            img = degrade(place_on_canvas(qr_img, rng), rng)
+            cv2.imwrite(os.path.join(class_dir, f"{qr_data}_{index}.jpg"), img,
+                        [cv2.IMWRITE_JPEG_QUALITY, 92])
+
+    return output_dir
+
+
+# ========== ПРОГОН ==========
+def load_corpus(corpus_dir):
+    """Собирает список (класс, путь, ожидаемые данные) из папки корпуса"""
+    corpus = []
+    for root, _, files in os.walk(corpus_dir):
+        relative = os.path.relpath(root, corpus_dir)
+        degradation = 'other' if relative == '.' else relative.replace(os.sep, '/')
+        for file_name in sorted(files):
+            if not file_name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            match = PAYLOAD_RE.search(file_name)
+            corpus.append((degradation, os.path.join(root, file_name),
+                           match.group(0) if match else None))
+    return corpus
+
+
+def percentile(values, percent):
+    """Перцентиль по отсортированному списку (без интерполяции)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Метрики по списку (попадание, задержка в мс)"""
+    latencies = [latency for _, latency in samples]
+    hits = sum(1 for hit, _ in samples if hit)
+    total = len(samples)
+    return {
+        'hits': hits,
+        'total': total,
+        'success_rate': round(hits / total, 4) if total else 0.0,
+        'mean_ms': round(sum(latencies) / total, 2) if total else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+def is_hit(data, expected):
+    """Проверяет результат декодирования (строка или список кодов)"""
+    if isinstance(data, list):
+        return bool(data) and (expected is None or expected in data)
+    return bool(data) and (expected is None or data == expected)
+
+
+def run_entry(decode, corpus):
+    """Прогоняет функцию декодирования по корпусу, метрики по классам искажений"""
+    by_class = {}
+
+    for degradation, file_path, expected in corpus:
+        started = time.perf_counter()
+        data = decode(file_path)
+        latency = (time.perf_counter() - started) * 1000
+        by_class.setdefault(degradation, []).append((is_hit(data, expected), latency))
+
+    results = {degradation: summarize(samples) for degradation, samples in sorted(by_class.items())}
+    results['all'] = summarize([sample for samples in by_class.values() for sample in samples])
+    return results
+
+
+def backend_decoder(name):
+    """Один проход движка по исходному кадру"""
+    def decode(file_path):
+        img = cv2.imread(file_path, cv2.IMREAD_COLOR)
+        if img is None:
+            return None
+        return decode_with_backend(name, img)
+    return decode
+
+
+def get_entries(available):
+    """Точки входа декодера, которые измеряет бенчмарк"""
+    entries = [
+        ('decode_qr_code_from_photo', decode_qr_code_from_photo),
+        ('enhanced_qr_decode', enhanced_qr_decode),
+        ('decode_with_filters', decode_with_filters),
+        ('decode_qr_payload', decode_qr_payload),
+        ('decode_qr_payloads', decode_qr_payloads),
+    ]
+    entries.extend((f"backend:{name}", backend_decoder(name)) for name in available)
+    return entries
+
+
+def get_commit():
+    """Текущий коммит git (если доступен)"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+# ========== ОТЧЕТ ==========
+def print_results(results):
+    """Печатает таблицу: точка входа -> класс искажения -> метрики"""
+    for entry, by_class in results.items():
+        print(f"\n🔎 {entry}")
+        print(f"{'Класс':<14}{'Успех':>12}{'Доля':>9}{'p50, мс':>11}{'p95, мс':>11}{'p99, мс':>11}")
+        print("-" * 68)
+        for degradation, metrics in by_class.items():
+            print(f"{degradation:<14}{metrics['hits']:>6}/{metrics['total']:<5}"
+                  f"{metrics['success_rate']:>9.1%}{metrics['p50_ms']:>11.1f}"
+                  f"{metrics['p95_ms']:>11.1f}{metrics['p99_ms']:>11.1f}")
+
+
+def print_comparison(baseline, results):
+    """Сравнивает текущий прогон с сохраненным JSON"""
+    print(f"\n📊 Сравнение с {baseline.get('commit') or 'предыдущим прогоном'}")
+    print(f"{'Точка входа / класс':<42}{'Δ доля':>10}{'Δ p50, мс':>12}{'Δ p95, мс':>12}")
+    print("-" * 76)
+    for entry, by_class in results.items():
+        old_by_class = baseline.get('results', {}).get(entry)
+        if not old_by_class:
+            continue
+        for degradation, metrics in by_class.items():
+            old = old_by_class.get(degradation)
+            if not old:
+                continue
+            print(f"{entry + ' / ' + degradation:<42}"
+                  f"{(metrics['success_rate'] - old['success_rate']) * 100:>+9.1f}%"
+                  f"{metrics['p50_ms'] - old['p50_ms']:>+12.1f}"
+                  f"{metrics['p95_ms'] - old['p95_ms']:>+12.1f}")
+
+
+def print_recommendation(results, available, min_hit_rate):
+    """Самый быстрый движок, который надежно распознает корпус"""
+    reliable = [name for name in available
+                if results[f"backend:{name}"]['all']['success_rate'] >= min_hit_rate]
+    if reliable:
+        best = min(reliable, key=lambda name: results[f"backend:{name}"]['all']['mean_ms'])
+        metrics = results[f"backend:{best}"]['all']
+        print(f"\n✅ Рекомендуемый основной движок: {best} "
+              f"({metrics['success_rate']:.1%}, {metrics['mean_ms']:.1f} мс)")
+    else:
+        print(f"\n⚠️ Ни один движок не распознал {min_hit_rate:.0%} корпуса")
+
+
+def run_benchmark(args, corpus_dir, synthetic):
+    """Прогон всех движков по корпусу: печать, сравнение и JSON-отчет"""
+    if synthetic:
+        generate_corpus(corpus_dir, args.samples, args.seed)
+        print(f"🧪 Синтетический корпус: {corpus_dir}")
+
+    corpus = load_corpus(corpus_dir)
+    if not corpus:
+        print(f"❌ В папке {corpus_dir} нет изображений")
+        return
+
+    available = get_available_backends()
+    skipped = [name for name in DECODER_BACKENDS if name not in available]
+
+    print(f"📂 Корпус: {len(corpus)} фото")
+    if skipped:
+        print(f"⚠️ Недоступны движки: {', '.join(skipped)}")
+
+    results = {}
+    for entry, decode in get_entries(available):
+        results[entry] = run_entry(decode, corpus)
+
+    print_results(results)
+    print_recommendation(results, available, args.min_hit_rate)
+
+    report = {
+        'commit': get_commit(),
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'decoder_backends': QR_DECODER_BACKENDS,
+        'corpus': {
+            'path': corpus_dir,
+            'synthetic': synthetic,
+            'samples': args.samples if synthetic else None,
+            'seed': args.seed if synthetic else None,
+            'size': len(corpus),
+        },
+        'results': results,
+    }
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(json.load(f), results)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены: {args.json_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк декодирования QR-кодов')
+    parser.add_argument('corpus', nargs='?',
+                        help='папка с фото QR-кодов (по умолчанию - синтетический корпус)')
+    parser.add_argument('--samples', type=int, default=20,
+                        help='фото на класс искажения в синтетическом корпусе')
+    parser.add_argument('--seed', type=int, default=42, help='seed синтетического корпуса')
+    parser.add_argument('--corpus-out', help='куда сохранить синтетический корпус')
+    parser.add_argument('--json', dest='json_path', help='сохранить результаты в JSON')
+    parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения')
+    parser.add_argument('--min-hit-rate', type=float, default=0.95,
+                        help='минимальная доля распознанных фото для рекомендации')
+    args = parser.parse_args()
+
+    synthetic = args.corpus is None
+    if synthetic and not args.corpus_out:
+        # Временный корпус удаляется после прогона
+        with tempfile.TemporaryDirectory(prefix='qr_corpus_') as corpus_dir:
+            run_benchmark(args, corpus_dir, synthetic)
+    else:
+        run_benchmark(args, args.corpus_out or args.corpus, synthetic)
+
+
+if __name__ == '__main__':
+    main()
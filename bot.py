@@ -4,11 +4,7 @@ from telebot import types
 import sqlite3
 import threading
 import time
-import qrcode
 from io import BytesIO
-import cv2
-import numpy as np
-from PIL import Image, ImageEnhance, ImageFilter, ImageOps, ImageDraw
 from dotenv import load_dotenv
 import logging
 import atexit
@@ -170,6 +166,8 @@ def create_inline_keyboard(event_id):
 
 def create_qr_code(event_number, user_id):
     """Создает QR-код с данными: номер мероприятия + 'U' + ID пользователя"""
+    import qrcode
+
     qr_data = f"{event_number}U{user_id}"
 
     qr = qrcode.QRCode(
@@ -288,6 +286,11 @@ def mark_attendance(user_id, event_name):
 
 def decode_qr_code_from_photo(file_path):
     """УЛУЧШЕННАЯ функция сканирования QR-кодов"""
+    # Обработка изображений загружается только при сканировании
+    import cv2
+    import numpy as np
+    from PIL import Image
+
     try:
         # Загружаем изображение
         pil_img = Image.open(file_path)
@@ -362,6 +365,10 @@ def decode_qr_code_from_photo(file_path):
 
 def enhanced_qr_decode(file_path):
     """УЛУЧШЕННАЯ функция сканирования QR-кодов с дополнительными методами"""
+    import cv2
+    import numpy as np
+    from PIL import Image, ImageEnhance, ImageOps
+
     try:
         # Загружаем изображение
         pil_img = Image.open(file_path)
@@ -0,0 +1,74 @@
+"""Сверка OpenCV-фильтров qr_utils с PIL.
+
+Запуск:
+    python check_filters.py
+
+Фильтры enhanced_qr_decode повторяют ImageEnhance.Contrast, ImageEnhance.Sharpness
+и ImageOps.autocontrast из PIL. Скрипт прогоняет через обе реализации градиент
+с известными значениями и случайные кадры и сравнивает результат попиксельно.
+Код выхода не 0, если расхождение больше MAX_DIFF.
+"""
+import sys
+import numpy as np
+from PIL import Image, ImageEnhance, ImageOps
+from qr_utils import _contrast, _sharpness, _autocontrast
+
+MAX_DIFF = 1
+
+# Градиент, на котором видно отражение отрицательных значений: черный должен остаться черным
+RAMP = np.array([[0, 30, 64, 100, 128, 200, 255]], np.uint8)
+RAMP_CONTRAST_2 = [0, 0, 17, 89, 145, 255, 255]
+
+
+def get_cases():
+    """(название, фильтр OpenCV, фильтр PIL)"""
+    cases = []
+    for factor in (2.0, 3.0):
+        cases.append((f"contrast {factor}",
+                      lambda gray, factor=factor: _contrast(gray, factor, np.empty_like(gray)),
+                      lambda img, factor=factor: ImageEnhance.Contrast(img).enhance(factor)))
+    cases.append(("sharpness 3.0",
+                  lambda gray: _sharpness(gray, 3.0, np.empty_like(gray), np.empty_like(gray)),
+                  lambda img: ImageEnhance.Sharpness(img).enhance(3.0)))
+    for cutoff in (2, 5):
+        cases.append((f"autocontrast {cutoff}",
+                      lambda gray, cutoff=cutoff: _autocontrast(gray, cutoff, np.empty_like(gray)),
+                      lambda img, cutoff=cutoff: ImageOps.autocontrast(img, cutoff=cutoff)))
+    return cases
+
+
+def get_images():
+    rng = np.random.default_rng(42)
+    return [
+        ("градиент", RAMP),
+        ("шум", rng.integers(0, 256, (64, 64), dtype=np.uint8)),
+        ("тусклый кадр", rng.integers(40, 120, (240, 320), dtype=np.uint8)),
+    ]
+
+
+def main():
+    failures = []
+
+    ramp_result = _contrast(RAMP, 2.0, np.empty_like(RAMP)).ravel().tolist()
+    if ramp_result != RAMP_CONTRAST_2:
+        failures.append(f"contrast 2.0 на градиенте: {ramp_result}, ожидалось {RAMP_CONTRAST_2}")
+
+    for image_name, gray in get_images():
+        for case_name, cv_filter, pil_filter in get_cases():
+            expected = np.asarray(pil_filter(Image.fromarray(gray)), dtype=np.int16)
+            diff = int(np.abs(cv_filter(gray).astype(np.int16) - expected).max())
+            mark = "✅" if diff <= MAX_DIFF else "❌"
+            print(f"{mark} {case_name:<16} {image_name:<14} расхождение {diff}")
+            if diff > MAX_DIFF:
+                failures.append(f"{case_name} ({image_name}): расхождение {diff}")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+
+    print("✅ Фильтры совпадают с PIL")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Проверка скорости запуска и памяти при импорте ботов.
+
+Запуск:
+    python check_startup.py                       # main.py с порогами по умолчанию
+    python check_startup.py --module bot          # старая версия бота
+    python check_startup.py --max-seconds 1.5 --max-rss-mb 45
+
+Модуль импортируется в отдельном процессе во временной папке (базы создаются
+там же). Проверяется время импорта, пиковая память процесса и то, что OpenCV,
+NumPy и qrcode не загружены до первого скана или QR-кода. PIL не проверяется:
+его загружает сам pyTelegramBotAPI. Для сравнения отдельно замеряется импорт
+qr_utils - столько ждал бы каждый запуск раньше.
+
+Порог памяти по умолчанию (50 МБ) лежит между ленивым запуском (~38 МБ)
+и прежним импортом с OpenCV (~75 МБ): возврат тяжелых импортов его превысит.
+
+Код выхода не 0, если порог превышен или тяжелые библиотеки загрузились при
+импорте - скрипт можно ставить в CI.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# PIL сюда не входит: telebot импортирует PIL.Image сам
+HEAVY_MODULES = ('cv2', 'numpy', 'qrcode')
+
+PROBE = '''
+import json, resource, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{
+    'seconds': seconds,
+    'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'heavy': [name for name in {heavy!r} if name in sys.modules],
+}}))
+'''
+
+
+def measure_import(module, repo_dir):
+    """Импортирует модуль в чистом процессе и возвращает замеры"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [repo_dir, env.get('PYTHONPATH')]))
+    env.setdefault('BOT_MODE', 'polling')
+
+    with tempfile.TemporaryDirectory(prefix='startup_') as work_dir:
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=work_dir, env=env, capture_output=True, text=True, timeout=120
+        )
+
+    if result.returncode != 0:
+        raise RuntimeError(f"импорт {module} завершился с ошибкой:\n{result.stderr.strip()}")
+    # Модули печатают при загрузке, замеры - последняя строка
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка скорости запуска ботов')
+    parser.add_argument('--module', default='main', help='модуль для проверки (main или bot)')
+    parser.add_argument('--max-seconds', type=float, default=2.0,
+                        help='максимальное время импорта, с')
+    parser.add_argument('--max-rss-mb', type=float, default=50.0,
+                        help='максимальная пиковая память процесса после импорта, МБ')
+    parser.add_argument('--skip-imaging', action='store_true',
+                        help='не замерять импорт qr_utils для сравнения')
+    args = parser.parse_args()
+
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+    try:
+        startup = measure_import(args.module, repo_dir)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+
+    rss_mb = startup['rss_kb'] / 1024
+    print(f"🚀 Импорт {args.module}: {startup['seconds']:.2f} с, память {rss_mb:.0f} МБ")
+
+    if not args.skip_imaging:
+        try:
+            imaging = measure_import('qr_utils', repo_dir)
+            print(f"🖼 Импорт qr_utils отдельно: {imaging['seconds']:.2f} с, "
+                  f"память {imaging['rss_kb'] / 1024:.0f} МБ")
+        except RuntimeError as e:
+            print(f"⚠️ {e}")
+
+    failures = []
+    if startup['heavy']:
+        failures.append(f"при запуске загружены: {', '.join(startup['heavy'])}")
+    if startup['seconds'] > args.max_seconds:
+        failures.append(f"импорт {startup['seconds']:.2f} с > {args.max_seconds} с")
+    if rss_mb > args.max_rss_mb:
+        failures.append(f"память {rss_mb:.0f} МБ > {args.max_rss_mb:.0f} МБ")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+
+    print("✅ Запуск в пределах порогов")
+
+
+if __name__ == '__main__':
+    main()
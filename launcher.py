@@ -0,0 +1,263 @@
+"""Запуск ботов отдельными процессами.
+
+Запуск:
+    python launcher.py                                  # admin, user и scanner - по процессу
+    python launcher.py --mode webhook admin user scanner=4
+    python launcher.py scanner                          # только сканер
+
+Каждая роль - отдельный интерпретатор main.py (BOT_ROLES=<роль>) со своим GIL
+и своими пулами: распознавание QR-кодов не отнимает процессор у регистрации
+и ответов на приглашения. Базы общие, соединения ждут блокировку до
+DB_BUSY_TIMEOUT миллисекунд. attendance.db и responses.db работают на журнале
+отката, а не в WAL: только так отметка о проходе пишется в обе базы атомарно.
+
+polling - Telegram отдает обновления бота только одному опрашивающему,
+поэтому у каждой роли ровно один процесс.
+webhook - лаунчер сам слушает PORT и пересылает /admin, /user и /scanner
+процессам роли. У каждого процесса свой порт на 127.0.0.1: PORT+1, PORT+2...
+подряд в порядке admin, user, scanner. Процесс выбирается по чату обновления,
+поэтому один чат всегда обслуживает один процесс: фото альбома собираются
+в один отчет, шаги регистрации идут по порядку, а защита от повторных нажатий
+в памяти процесса видит все нажатия пользователя. Снаружи нужен только PORT,
+как у bot.py.
+
+Режим дня мероприятия (гости в памяти) держат процессы, которые отмечают гостей:
+admin и scanner. Мероприятия включаются командой /eventday в админ-боте и
+подхватываются остальными процессами из таблицы event_days.
+
+Единственный процесс сканера пишет отметки в фоне пачками. Админ-бот рядом с ним
+и процессы роли, запущенной в нескольких экземплярах (scanner=4), пишут каждую
+первую отметку сразу условной записью в базу (EVENT_DAY_SHARED=1): повторный скан
+в другом процессе не станет вторым успехом. Отметки админ-бота сканер подтягивает
+в свой индекс раз в EVENT_DAY_SYNC_INTERVAL секунд. Упавший процесс
+перезапускается через несколько секунд.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROLES = ('admin', 'user', 'scanner')
+# Роли, которые отмечают гостей по QR-кодам
+CHECK_IN_ROLES = ('admin', 'scanner')
+RESTART_DELAY = 5
+STOP_TIMEOUT = 10
+# Сколько ждать ответа процесса роли при пересылке обновления, с
+PROXY_TIMEOUT = 10
+# Заголовки запроса Telegram, которые пересылаются процессу роли
+PROXY_HEADERS = ('Content-Type', 'X-Telegram-Bot-Api-Secret-Token')
+
+
+def parse_roles(specs):
+    """['admin', 'scanner=4'] -> {'admin': 1, 'scanner': 4}"""
+    counts = {}
+    for spec in specs or ROLES:
+        role, _, count = spec.partition('=')
+        role = role.strip().lower()
+        if role not in ROLES:
+            raise ValueError(f"неизвестная роль '{role}', доступны: {', '.join(ROLES)}")
+        if count and (not count.isdigit() or int(count) < 1):
+            raise ValueError(f"число процессов для {role} должно быть целым больше нуля")
+        counts[role] = int(count) if count else 1
+    return counts
+
+
+def process_port(role, index, counts, base_port):
+    """Внутренний порт процесса: следующие за PORT подряд для всех процессов в порядке ROLES"""
+    offset = sum(counts.get(name, 0) for name in ROLES[:ROLES.index(role)])
+    return base_port + 1 + offset + index
+
+
+def get_update_chat_id(update):
+    """Чат обновления Telegram, как в main.get_update_chat_id (для кнопок - пользователь)"""
+    message = update.get('message') or update.get('edited_message')
+    if message:
+        return message['chat']['id']
+    if update.get('callback_query'):
+        return update['callback_query']['from']['id']
+    return None
+
+
+def build_env(role, index, counts, mode, base_port):
+    """Окружение процесса: роль, номер процесса, порт и режим дня мероприятия"""
+    env = dict(os.environ)
+    env['BOT_MODE'] = mode
+    env['BOT_ROLES'] = role
+    env['BOT_PROCESS_INDEX'] = str(index)
+    # Снаружи обновления принимает лаунчер, процессы ролей слушают только localhost
+    env['PORT'] = str(process_port(role, index, counts, base_port))
+    env['WEBHOOK_HOST'] = '127.0.0.1'
+
+    # Индекс гостей нужен только тем, кто отмечает гостей. Единственный сканер пишет
+    # отметки в фоне; остальные, если отмечают не одни, - сразу в базу
+    check_in_processes = sum(counts.get(name, 0) for name in CHECK_IN_ROLES)
+    single_scanner = role == 'scanner' and counts[role] == 1
+    if role not in CHECK_IN_ROLES:
+        env['EVENT_DAY_INDEX'] = '0'
+    elif check_in_processes > 1 and not single_scanner:
+        env['EVENT_DAY_SHARED'] = '1'
+
+    # Следующий шаг диалога может прийти в другой процесс роли
+    if counts[role] > 1:
+        env['STATE_BACKEND'] = 'sqlite'
+    return env
+
+
+def start_process(role, index, counts, mode, base_port):
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    process = subprocess.Popen([sys.executable, main_path],
+                               env=build_env(role, index, counts, mode, base_port))
+    print(f"🚀 {role} №{index + 1}: pid {process.pid}")
+    return process
+
+
+def stop_processes(processes):
+    """Останавливает процессы: сначала SIGTERM, через STOP_TIMEOUT секунд - SIGKILL"""
+    for process in processes.values():
+        if process and process.poll() is None:
+            process.terminate()
+
+    deadline = time.monotonic() + STOP_TIMEOUT
+    for process in processes.values():
+        if not process:
+            continue
+        try:
+            process.wait(timeout=max(0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    """Пересылает POST /<роль> процессу роли, который обслуживает чат; GET /health - лаунчер жив"""
+    role_ports = {}
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b'ok')
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def do_POST(self):
+        ports = self.role_ports.get(self.path)
+        if not ports:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            chat_id = get_update_chat_id(json.loads(body))
+        except (ValueError, TypeError, KeyError, AttributeError):
+            chat_id = None
+        # Обновления без чата (и некорректные) - первому процессу роли
+        port = ports[chat_id % len(ports)] if isinstance(chat_id, int) else ports[0]
+        headers = {name: self.headers[name] for name in PROXY_HEADERS if self.headers.get(name)}
+        request = urllib.request.Request(f"http://127.0.0.1:{port}{self.path}", data=body,
+                                         headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=PROXY_TIMEOUT) as response:
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except (urllib.error.URLError, OSError) as e:
+            # Процесс роли перезапускается: Telegram повторит обновление позже
+            print(f"❌ Процесс для {self.path} недоступен: {e}")
+            status = 502
+
+        self.send_response(status)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_proxy(counts, base_port):
+    """HTTP-сервер на PORT, который раздает обновления по внутренним портам ролей"""
+    ProxyHandler.role_ports = {
+        f'/{role}': [process_port(role, index, counts, base_port) for index in range(count)]
+        for role, count in counts.items()
+    }
+    server = ThreadingHTTPServer(('', base_port), ProxyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"✅ Лаунчер принимает вебхуки на порту {base_port}")
+    return server
+
+
+def supervise(counts, mode, base_port):
+    """Запускает процессы ролей и перезапускает упавшие"""
+    proxy = start_proxy(counts, base_port) if mode == 'webhook' else None
+    processes = {}
+    restart_at = {}
+    for role, count in counts.items():
+        for index in range(count):
+            processes[(role, index)] = start_process(role, index, counts, mode, base_port)
+
+    stopping = []
+
+    def request_stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    try:
+        while not stopping:
+            for key, process in processes.items():
+                if key in restart_at:
+                    if time.monotonic() >= restart_at[key]:
+                        del restart_at[key]
+                        processes[key] = start_process(key[0], key[1], counts, mode, base_port)
+                elif process.poll() is not None:
+                    print(f"❌ {key[0]} №{key[1] + 1} завершился с кодом {process.returncode}, "
+                          f"перезапуск через {RESTART_DELAY} секунд...")
+                    restart_at[key] = time.monotonic() + RESTART_DELAY
+            time.sleep(1)
+    finally:
+        print("\n🛑 Остановка всех процессов...")
+        if proxy:
+            proxy.shutdown()
+        stop_processes(processes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запуск ботов отдельными процессами')
+    parser.add_argument('roles', nargs='*',
+                        help='роли и число процессов: admin user scanner=4 (по умолчанию все по одному)')
+    parser.add_argument('--mode', choices=('polling', 'webhook'),
+                        default=os.getenv('BOT_MODE', 'polling'), help='способ получения обновлений')
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '8080')),
+                        help='порт для вебхуков Telegram, процессы ролей слушают следующие порты на localhost')
+    args = parser.parse_args()
+
+    try:
+        counts = parse_roles(args.roles)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.mode == 'polling' and any(count > 1 for count in counts.values()):
+        parser.error("несколько процессов одной роли возможны только в режиме webhook")
+
+    print("=" * 50)
+    print(f"🤖 ЗАПУСК БОТОВ ОТДЕЛЬНЫМИ ПРОЦЕССАМИ ({args.mode.upper()})")
+    print("=" * 50)
+    for role, count in counts.items():
+        ports = [str(process_port(role, index, counts, args.port)) for index in range(count)]
+        port = f", порты {', '.join(ports)}" if args.mode == 'webhook' else ""
+        print(f"   {role}: процессов {count}{port}")
+    print("=" * 50)
+
+    supervise(counts, args.mode, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,22 @@
 import os
 import telebot
 from telebot import types
+from telebot.handler_backends import BaseMiddleware, CancelUpdate
 import sqlite3
+import re
+import csv
+import json
+import codecs
+import tempfile
 import threading
 import time
-import qrcode
+import queue
+import atexit
 from io import BytesIO
-import cv2
-import numpy as np
-from PIL import Image, ImageEnhance, ImageFilter, ImageOps, ImageDraw
 import concurrent.futures
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from state_store import create_state_store
 from config import ADMIN_BOT_TOKEN, USER_BOT_TOKEN, SCANNER_BOT_TOKEN, ADMIN_IDS
 
 # ========== СОЗДАНИЕ ВСЕХ БОТОВ ==========
@@ -17,10 +24,10 @@ print("=" * 50)
 print("🤖 ЗАГРУЗКА СИСТЕМЫ ПРИГЛАШЕНИЙ")
 print("=" * 50)
 
-# Создаем боты
-admin_bot = telebot.TeleBot(ADMIN_BOT_TOKEN)
-user_bot = telebot.TeleBot(USER_BOT_TOKEN)
-scanner_bot = telebot.TeleBot(SCANNER_BOT_TOKEN)  # Новый бот для сканирования
+# Создаем боты (обработчики выполняются в пулах из раздела очередей, а не в потоках telebot)
+admin_bot = telebot.TeleBot(ADMIN_BOT_TOKEN, threaded=False)
+user_bot = telebot.TeleBot(USER_BOT_TOKEN, threaded=False, use_class_middlewares=True)
+scanner_bot = telebot.TeleBot(SCANNER_BOT_TOKEN, threaded=False)  # Новый бот для сканирования
 
 print(f"✅ Создано ботов:")
 print(f"   📱 Админ-бот: {ADMIN_BOT_TOKEN[:10]}...")
@@ -28,6 +35,164 @@ print(f"   👥 Пользовательский бот: {USER_BOT_TOKEN[:10]}..
 print(f"   🔍 QR-Сканер: {SCANNER_BOT_TOKEN[:10]}...")
 print("=" * 50)
 
+# ========== ОЧЕРЕДИ ОБРАБОТКИ ОБНОВЛЕНИЙ ==========
+# У каждого класса работы свой пул: сканы на входе, ответы на приглашения и команды
+# администратора не ждут друг друга, а выгрузки и рассылки уходят в фоновый пул bulk.
+# Все обновления одного чата выполняет один и тот же поток по порядку - шаги диалога
+# (в том числе фото мероприятия и скан в админ-боте) не обгоняют друг друга.
+UPDATE_POOLS_CONFIG = {
+    # класс: (потоков, мест в очереди)
+    'scanner': (int(os.getenv('SCANNER_POOL_WORKERS', '8')), 400),
+    'rsvp': (int(os.getenv('RSVP_POOL_WORKERS', '8')), 800),
+    'admin': (int(os.getenv('ADMIN_POOL_WORKERS', '2')), 50),
+}
+
+# Фоновые задачи, которые запускают обработчики: (потоков, мест в очереди)
+TASK_POOLS_CONFIG = {
+    # QR-код и сообщения после ответа на приглашение
+    'replies': (int(os.getenv('RSVP_WORKERS', '4')), 500),
+    # Рассылки, объявления, выгрузки и отчеты: два потока, чтобы отчет не ждал рассылку
+    'bulk': (int(os.getenv('BULK_POOL_WORKERS', '2')), 10),
+    # Скачивание и распознавание фото одного альбома
+    'album': (int(os.getenv('ALBUM_SCAN_WORKERS', '4')), 50),
+}
+
+
+class ChatPool:
+    """Пул потоков, где у каждого потока своя ограниченная очередь.
+
+    Задачи одного чата попадают в один поток и выполняются по порядку.
+    При переполнении очереди задача не принимается (submit возвращает False):
+    опрос Telegram и HTTP-сервер не должны ждать из-за одного занятого потока.
+    """
+
+    def __init__(self, name, workers, queue_size):
+        self.name = name
+        self.queues = [queue.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+
+    def start(self):
+        """Запускает потоки пула (при запуске ботов, а не при импорте)"""
+        for index, tasks in enumerate(self.queues):
+            threading.Thread(target=self._work, args=(tasks,), name=f"{self.name}_{index}", daemon=True).start()
+
+    def _work(self, tasks):
+        while True:
+            fn, args = tasks.get()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"❌ Ошибка в пуле {self.name}: {e}")
+            finally:
+                tasks.task_done()
+
+    def submit(self, chat_id, fn, *args):
+        try:
+            self.queues[hash(chat_id) % len(self.queues)].put_nowait((fn, args))
+            return True
+        except queue.Full:
+            return False
+
+
+class BoundedPool:
+    """Пул потоков с ограниченной очередью: при переполнении отправитель ждет, а не копит задачи в памяти"""
+
+    def __init__(self, name, workers, queue_size):
+        self.name = name
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def submit(self, fn, *args):
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+
+update_pools = {name: ChatPool(name, workers, queue_size)
+                for name, (workers, queue_size) in UPDATE_POOLS_CONFIG.items()}
+task_pools = {name: BoundedPool(name, workers, queue_size)
+              for name, (workers, queue_size) in TASK_POOLS_CONFIG.items()}
+
+
+# Бот -> класс его обновлений
+BOT_POOLS = {
+    scanner_bot: 'scanner',
+    user_bot: 'rsvp',
+    admin_bot: 'admin',
+}
+
+
+def get_update_chat_id(update):
+    """Чат, к которому относится обновление (для кнопок - пользователь)"""
+    message = update.message or update.edited_message
+    if message:
+        return message.chat.id
+    if update.callback_query:
+        return update.callback_query.from_user.id
+    return None
+
+
+def process_update(bot, bot_name, update):
+    """Обрабатывает одно обновление в пуле его класса"""
+    try:
+        bot.process_new_updates([update])
+    except Exception as e:
+        print(f"❌ Ошибка в {bot_name}: {e}")
+
+
+def dispatch_update(bot, bot_name, update):
+    """Отправляет обновление в пул его класса, в очередь его чата. False - очередь переполнена"""
+    chat_id = get_update_chat_id(update)
+    if update_pools[BOT_POOLS[bot]].submit(chat_id, process_update, bot, bot_name, update):
+        return True
+
+    print(f"⚠️ [{bot_name}] Очередь чата {chat_id} переполнена, обновление {update.update_id} пропущено")
+    return False
+
+
+def run_bulk(fn, *args):
+    """Запускает массовую работу (рассылки) в отдельном пуле, не занимая обработчики"""
+    def job():
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"❌ Ошибка массовой задачи {fn.__name__}: {e}")
+
+    return task_pools['bulk'].submit(job)
+
+
+# ========== ЛЕНИВАЯ ЗАГРУЗКА ОБРАБОТКИ ИЗОБРАЖЕНИЙ ==========
+# OpenCV, NumPy, PIL и qrcode (модуль qr_utils) загружаются при первом скане или QR-коде,
+# либо в фоне сразу после запуска ботов, а не при импорте main.py
+QR_PRELOAD = os.getenv('QR_PRELOAD', '1') == '1'
+
+
+def load_qr_utils():
+    """Модуль qr_utils; первый вызов импортирует тяжелые библиотеки"""
+    import qr_utils
+    return qr_utils
+
+
+def preload_imaging():
+    """Загружает обработку изображений заранее, чтобы первый скан не ждал импорта"""
+    started = time.perf_counter()
+    try:
+        load_qr_utils()
+        print(f"🖼 Обработка изображений загружена за {time.perf_counter() - started:.1f} с")
+    except Exception as e:
+        print(f"❌ Ошибка загрузки обработки изображений: {e}")
+
+
+def start_imaging_preload():
+    """Фоновая загрузка обработки изображений после запуска ботов (QR_PRELOAD=0 - отключить)"""
+    if QR_PRELOAD:
+        threading.Thread(target=preload_imaging, daemon=True).start()
+
+
 # ========== КЕШИРОВАНИЕ ФОТО ==========
 photo_cache = {}
 
@@ -50,9 +215,66 @@ def get_cached_photo(event_photo_id):
         return None
 
 
+# ========== КЕШ РЕЗУЛЬТАТОВ СКАНИРОВАНИЯ ==========
+# (file_unique_id фото, multi) -> найденные QR-коды. Повторно пересланное фото
+# сразу идет на проверку посещения без скачивания и декодирования. Результат
+# одиночного сканирования не подходит для поиска всех кодов, поэтому режимы
+# кешируются раздельно.
+QR_DECODE_CACHE_SIZE = int(os.getenv('QR_DECODE_CACHE_SIZE', '512'))
+qr_decode_cache = OrderedDict()
+qr_decode_cache_lock = threading.Lock()
+
+
+def get_cached_qr_payloads(file_unique_id, multi):
+    """Возвращает ранее найденные QR-коды для фото или None"""
+    with qr_decode_cache_lock:
+        key = (file_unique_id, multi)
+        payloads = qr_decode_cache.get(key)
+        if payloads is None and not multi:
+            # Все коды фото уже известны - первый из них годится и для одиночного режима
+            key = (file_unique_id, True)
+            payloads = qr_decode_cache.get(key)
+        if payloads is None:
+            return None
+
+        qr_decode_cache.move_to_end(key)
+        return payloads if multi else payloads[:1]
+
+
+def cache_qr_payloads(file_unique_id, multi, payloads):
+    """Запоминает найденные QR-коды, вытесняя самые старые записи"""
+    if QR_DECODE_CACHE_SIZE <= 0:
+        return
+
+    with qr_decode_cache_lock:
+        key = (file_unique_id, multi)
+        qr_decode_cache[key] = list(payloads)
+        qr_decode_cache.move_to_end(key)
+        while len(qr_decode_cache) > QR_DECODE_CACHE_SIZE:
+            qr_decode_cache.popitem(last=False)
+
+
 # ========== СОЗДАНИЕ НОВЫХ БАЗ ДАННЫХ ==========
+# Базы общие для всех процессов ботов (см. launcher.py): в режиме WAL чтение не ждет записи,
+# а занятая база ждет до DB_BUSY_TIMEOUT миллисекунд вместо ошибки "database is locked"
+DB_BUSY_TIMEOUT = int(os.getenv('DB_BUSY_TIMEOUT', '10000'))
+
+# Отметка о проходе и ответ гостя пишутся одной транзакцией в две базы (checkin_conn).
+# В режиме WAL такая транзакция атомарна только для каждой базы по отдельности,
+# поэтому эти базы остаются на журнале отката: он фиксирует обе базы вместе.
+ROLLBACK_JOURNAL_DBS = ('attendance.db', 'responses.db')
+
+
+def connect_db(path, **kwargs):
+    """Соединение с базой с ожиданием блокировки; WAL везде, кроме ROLLBACK_JOURNAL_DBS"""
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT / 1000, check_same_thread=False, **kwargs)
+    journal_mode = 'DELETE' if path in ROLLBACK_JOURNAL_DBS else 'WAL'
+    conn.execute(f'PRAGMA journal_mode={journal_mode}')
+    return conn
+
+
 # 1. База данных для пользователей
-users_conn = sqlite3.connect('users.db', check_same_thread=False)
+users_conn = connect_db('users.db')
 users_cursor = users_conn.cursor()
 
 users_cursor.execute('''
@@ -65,7 +287,7 @@ CREATE TABLE IF NOT EXISTS users (
 users_conn.commit()
 
 # 2. База данных для мероприятий
-events_conn = sqlite3.connect('events.db', check_same_thread=False)
+events_conn = connect_db('events.db')
 events_cursor = events_conn.cursor()
 
 events_cursor.execute('''
@@ -76,10 +298,17 @@ CREATE TABLE IF NOT EXISTS events (
     invitation_text TEXT
 )
 ''')
+
+# Мероприятия в режиме дня мероприятия: общий список для всех процессов ботов
+events_cursor.execute('''
+CREATE TABLE IF NOT EXISTS event_days (
+    event_id INTEGER PRIMARY KEY
+)
+''')
 events_conn.commit()
 
 # 3. База данных для ответов пользователей на приглашения
-responses_conn = sqlite3.connect('responses.db', check_same_thread=False)
+responses_conn = connect_db('responses.db')
 responses_cursor = responses_conn.cursor()
 
 responses_cursor.execute('''
@@ -105,7 +334,7 @@ CREATE TABLE IF NOT EXISTS invitation_messages (
 ''')
 
 # 5. БАЗА ДАННЫХ ДЛЯ ПОСЕЩАЕМОСТИ (УПРОЩЕННАЯ)
-attendance_conn = sqlite3.connect('attendance.db', check_same_thread=False)
+attendance_conn = connect_db('attendance.db')
 attendance_cursor = attendance_conn.cursor()
 
 attendance_cursor.execute('''
@@ -118,14 +347,47 @@ CREATE TABLE IF NOT EXISTS attendance (
 )
 ''')
 
+
+def add_column_if_missing(cursor, table, column, definition):
+    """Миграция: добавляет столбец в уже существующую таблицу"""
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+# Время событий (unix-время в секундах): ответ, отправка приглашения, скан на входе
+add_column_if_missing(responses_cursor, 'user_responses', 'responded_at', 'INTEGER')
+add_column_if_missing(responses_cursor, 'invitation_messages', 'sent_at', 'INTEGER')
+add_column_if_missing(attendance_cursor, 'attendance', 'scanned_at', 'INTEGER')
+
 # Создаем индексы
 responses_cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_event ON user_responses (user_id, event_id)')
 responses_cursor.execute('CREATE INDEX IF NOT EXISTS idx_msg_user_event ON invitation_messages (user_id, event_id)')
 attendance_cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_user_event ON attendance (user_id, event_name)')
+responses_cursor.execute('CREATE INDEX IF NOT EXISTS idx_responses_event_time ON user_responses (event_id, responded_at)')
+responses_cursor.execute('CREATE INDEX IF NOT EXISTS idx_msg_event_time ON invitation_messages (event_id, sent_at)')
+attendance_cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_event_time ON attendance (event_name, scanned_at)')
 
 responses_conn.commit()
 attendance_conn.commit()
 
+# 6. Отдельное соединение для отметок: посещение и ответ пишутся одной транзакцией.
+# Через него же под checkin_lock читаются гости и мероприятия: users_cursor и
+# events_cursor нельзя делить между потоками пулов.
+checkin_conn = connect_db('attendance.db', isolation_level=None)
+for schema in ('responses', 'users', 'events'):
+    checkin_conn.execute(f"ATTACH DATABASE '{schema}.db' AS {schema}")
+checkin_lock = threading.Lock()
+
+
+def open_readonly_connection():
+    """Соединение только для чтения со всеми базами: отчеты не блокируют запись"""
+    conn = sqlite3.connect('file:events.db?mode=ro', uri=True, timeout=DB_BUSY_TIMEOUT / 1000,
+                           check_same_thread=False)
+    for schema in ('users', 'responses', 'attendance'):
+        conn.execute(f"ATTACH DATABASE 'file:{schema}.db?mode=ro' AS {schema}")
+    return conn
+
 print("✅ Все базы данных созданы/проверены")
 print("=" * 50)
 
@@ -144,7 +406,7 @@ admin_keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
 admin_keyboard.add("📨 Рассылка приглашений", "🔍 Сканировать QR")
 admin_keyboard.add("📢 Объявление", "👤 Редактировать пользователя")
 admin_keyboard.add("📊 Статистика приглашений", "👥 Статистика посетивших")
-admin_keyboard.add("❌ Отмена операции")
+admin_keyboard.add("📈 Сводка по мероприятиям", "❌ Отмена операции")
 
 
 # ========== ФУНКЦИИ ДЛЯ РАБОТЫ С БАЗОЙ ДАННЫХ ==========
@@ -163,28 +425,6 @@ def create_inline_keyboard(event_id):
     return keyboard
 
 
-def create_qr_code(event_number, user_id):
-    """Создает QR-код с данными: номер мероприятия + 'U' + ID пользователя"""
-    qr_data = f"{event_number}U{user_id}"
-
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-
-    img = qr.make_image(fill_color="black", back_color="white")
-
-    bio = BytesIO()
-    img.save(bio, 'PNG')
-    bio.seek(0)
-
-    return bio, qr_data
-
-
 def get_next_event_number():
     """Получает следующий номер мероприятия"""
     events_cursor.execute('SELECT MAX(event_id) FROM events')
@@ -207,8 +447,9 @@ def save_user_response(user_id, event_id, response):
     """Сохраняет ответ пользователя"""
     try:
         responses_cursor.execute(
-            'INSERT OR REPLACE INTO user_responses (user_id, event_id, response, qr_sent) VALUES (?, ?, ?, 0)',
-            (user_id, event_id, response)
+            'INSERT OR REPLACE INTO user_responses (user_id, event_id, response, qr_sent, responded_at) '
+            'VALUES (?, ?, ?, 0, ?)',
+            (user_id, event_id, response, int(time.time()))
         )
         responses_conn.commit()
         return True
@@ -235,8 +476,8 @@ def save_invitation_message(user_id, event_id, message_id):
     """Сохраняет ID сообщения с приглашением"""
     try:
         responses_cursor.execute(
-            'INSERT OR REPLACE INTO invitation_messages (user_id, event_id, message_id) VALUES (?, ?, ?)',
-            (user_id, event_id, message_id)
+            'INSERT OR REPLACE INTO invitation_messages (user_id, event_id, message_id, sent_at) VALUES (?, ?, ?, ?)',
+            (user_id, event_id, message_id, int(time.time()))
         )
         responses_conn.commit()
         return True
@@ -246,7 +487,7 @@ def save_invitation_message(user_id, event_id, message_id):
 
 
 def get_invitation_message_id(user_id, event_id):
-    """Получает ID сообщения с приглашением"""
+    """Получает ID сообщения с приглашением (для массовых изменений приглашений)"""
     responses_cursor.execute(
         'SELECT message_id FROM invitation_messages WHERE user_id = ? AND event_id = ?',
         (user_id, event_id)
@@ -255,27 +496,36 @@ def get_invitation_message_id(user_id, event_id):
     return result[0] if result else None
 
 
-def mark_attendance(user_id, event_name):
-    """Отмечает посещение пользователя"""
-    try:
-        # Проверяем, не отмечен ли уже пользователь
-        attendance_cursor.execute(
-            'SELECT attendance_status FROM attendance WHERE user_id = ? AND event_name = ?',
-            (user_id, event_name)
-        )
-        existing = attendance_cursor.fetchone()
+# Отметка меняет строку, только если гость еще не отмечен:
+# число измененных строк само говорит, успешен скан или повторный
+MARK_ATTENDANCE_SQL = '''
+    INSERT INTO attendance (user_id, event_name, attendance_status, scanned_at) VALUES (?, ?, 1, ?)
+    ON CONFLICT(user_id, event_name) DO UPDATE SET attendance_status = 1, scanned_at = excluded.scanned_at
+    WHERE attendance_status = 0
+'''
+# Ответ 'Да' для отсканированного гостя, если он не отвечал на приглашение
+MARK_RESPONSE_SQL = '''
+    INSERT OR IGNORE INTO responses.user_responses (user_id, event_id, response, qr_sent, responded_at)
+    VALUES (?, ?, 'yes', 1, ?)
+'''
 
-        if existing and existing[0] == 1:
-            return "already_scanned"
 
-        # Добавляем или обновляем запись
-        attendance_cursor.execute(
-            'INSERT OR REPLACE INTO attendance (user_id, event_name, attendance_status) '
-            'VALUES (?, ?, ?)',
-            (user_id, event_name, 1)
-        )
-        attendance_conn.commit()
-        return "success"
+def mark_attendance(user_id, event_name, event_id=None):
+    """Отмечает посещение пользователя (и ответ 'Да' при event_id) одной транзакцией"""
+    try:
+        with checkin_lock:
+            checkin_conn.execute('BEGIN IMMEDIATE')
+            try:
+                scanned_at = int(time.time())
+                marked = checkin_conn.execute(MARK_ATTENDANCE_SQL, (user_id, event_name, scanned_at)).rowcount
+                if marked and event_id is not None:
+                    checkin_conn.execute(MARK_RESPONSE_SQL, (user_id, event_id, scanned_at))
+                checkin_conn.execute('COMMIT')
+            except Exception:
+                checkin_conn.execute('ROLLBACK')
+                raise
+
+        return "success" if marked else "already_scanned"
     except Exception as e:
         print(f"❌ Ошибка отметки посещения: {e}")
         return "error"
@@ -283,312 +533,692 @@ def mark_attendance(user_id, event_name):
 
 def get_user_info(user_id):
     """Получает информацию о пользователе"""
-    users_cursor.execute('SELECT name, surname FROM users WHERE telegram_id = ?', (user_id,))
-    return users_cursor.fetchone()
+    with checkin_lock:
+        return checkin_conn.execute('SELECT name, surname FROM users.users WHERE telegram_id = ?',
+                                    (user_id,)).fetchone()
 
 
 def get_event_info(event_id):
     """Получает информацию о мероприятии"""
-    events_cursor.execute('SELECT event_name FROM events WHERE event_id = ?', (event_id,))
-    return events_cursor.fetchone()
+    with checkin_lock:
+        return checkin_conn.execute('SELECT event_name FROM events.events WHERE event_id = ?',
+                                    (event_id,)).fetchone()
+
+
+# ========== РЕЖИМ ДНЯ МЕРОПРИЯТИЯ ==========
+# Для активного мероприятия ожидаемые гости загружаются в память:
+# проверка QR-кода не ходит в базы, а отметки пишутся в фоне пачками.
+# Мероприятия можно включить при запуске: EVENT_DAY_IDS="3,4"
+EVENT_DAY_IDS = os.getenv('EVENT_DAY_IDS', '')
+EVENT_DAY_INDEX = os.getenv('EVENT_DAY_INDEX', '1') == '1'
+# Индекс живет в памяти процесса. EVENT_DAY_SHARED=1 - отметки пишутся сразу: первый
+# скан гостя подтверждается условной записью в базу, а не фоновой очередью. launcher.py
+# ставит его процессам, рядом с которыми гостей отмечают другие процессы той же роли,
+# и админ-боту рядом со сканером; единственный процесс сканера пишет отметки в фоне.
+EVENT_DAY_SHARED = os.getenv('EVENT_DAY_SHARED', '0') == '1'
+# Как часто (секунды) процесс сверяет свои мероприятия с таблицей event_days
+# и отмечает в индексе гостей, которых отметили другие процессы
+EVENT_DAY_SYNC_INTERVAL = float(os.getenv('EVENT_DAY_SYNC_INTERVAL', '5'))
+
+# event_id -> {'event_name': ..., 'attendees': {user_id: {'name', 'surname', 'scanned'}}}
+event_day_index = {}
+event_day_lock = threading.Lock()
+
+# Очередь отметок (user_id, event_id, event_name, scanned_at) для фоновой записи
+attendance_write_queue = queue.Queue()
+
+# Сколько раз повторять запись пачки отметок (паузы 1, 2, 4... секунды), прежде чем
+# записать отметки по одной и отложить те, что так и не записались
+ATTENDANCE_WRITE_ATTEMPTS = int(os.getenv('ATTENDANCE_WRITE_ATTEMPTS', '4'))
+
+# Отметки, которые не удалось записать (в индексе гость уже отмечен). Они хранятся
+# в файле и переживают перезапуск, повторяются каждые ATTENDANCE_RETRY_INTERVAL секунд
+# и с каждой новой пачкой, а их число показывает /eventday
+PARKED_ATTENDANCE_FILE = os.getenv('PARKED_ATTENDANCE_FILE', 'attendance_parked.jsonl')
+ATTENDANCE_RETRY_INTERVAL = float(os.getenv('ATTENDANCE_RETRY_INTERVAL', '30'))
+parked_attendance_writes = []
+
+# Гости мероприятия: ответившие 'Да' и уже отмеченные, имена - по первичному ключу users
+EVENT_DAY_GUESTS_SQL = '''
+    SELECT u.telegram_id, u.name, u.surname, g.scanned
+    FROM (
+        SELECT user_id, MAX(scanned) AS scanned FROM (
+            SELECT user_id, 0 AS scanned FROM responses.user_responses
+            WHERE event_id = ? AND response = 'yes'
+            UNION ALL
+            SELECT user_id, 1 FROM attendance.attendance
+            WHERE event_name = ? AND attendance_status = 1
+        )
+        GROUP BY user_id
+    ) g
+    JOIN users u ON u.telegram_id = g.user_id
+'''
 
 
-# ========== ФУНКЦИИ ДЛЯ СКАНИРОВАНИЯ QR-КОДОВ ==========
-def decode_qr_code_from_photo(file_path):
-    """УЛУЧШЕННАЯ функция сканирования QR-кодов"""
+def load_event_day(event_id):
+    """Загружает в память гостей мероприятия (ответившие 'Да' и уже отмеченные)"""
+    if not EVENT_DAY_INDEX:
+        return None
+
+    event_info = get_event_info(event_id)
+    if not event_info:
+        return None
+
+    event_name = event_info[0]
+
+    # Отдельное соединение: загрузка не мешает сканированию на общих курсорах
+    guests_db = connect_db('users.db')
     try:
-        pil_img = Image.open(file_path)
-
-        width, height = pil_img.size
-        if width < 300 or height < 300:
-            new_width = max(600, width * 3)
-            new_height = max(600, height * 3)
-            pil_img = pil_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        original_img = pil_img.copy()
-        img = cv2.cvtColor(np.array(original_img), cv2.COLOR_RGB2BGR)
-        qr_detector = cv2.QRCodeDetector()
-
-        processing_methods = [
-            ("Оригинал", img),
-            ("Черно-белое", cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)),
-            ("Повышенная яркость", cv2.convertScaleAbs(img, alpha=1.5, beta=40)),
-            ("Высокий контраст", cv2.convertScaleAbs(img, alpha=2.0, beta=0)),
-            ("Размытие + резкость", cv2.GaussianBlur(img, (5, 5), 0)),
-            ("Медианный фильтр", cv2.medianBlur(img, 3)),
-            ("Бинаризация", cv2.adaptiveThreshold(
-                cv2.cvtColor(img, cv2.COLOR_BGR2GRAY),
-                255,
-                cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                cv2.THRESH_BINARY, 11, 2
-            )),
-        ]
-
-        found_data = []
-
-        for method_name, processed_img in processing_methods:
+        guests_db.execute("ATTACH DATABASE 'responses.db' AS responses")
+        guests_db.execute("ATTACH DATABASE 'attendance.db' AS attendance")
+        attendees = {
+            user_id: {'name': name, 'surname': surname, 'scanned': bool(scanned)}
+            for user_id, name, surname, scanned in guests_db.execute(
+                EVENT_DAY_GUESTS_SQL, (event_id, event_name)
+            )
+        }
+    finally:
+        guests_db.close()
+
+    with event_day_lock:
+        event_day_index[event_id] = {'event_name': event_name, 'attendees': attendees}
+
+    print(f"📋 Режим дня мероприятия: {event_name} (№{event_id}), гостей в памяти: {len(attendees)}")
+    return event_day_index[event_id]
+
+
+def unload_event_day(event_id):
+    """Выключает режим дня мероприятия и дописывает накопленные отметки"""
+    with event_day_lock:
+        event = event_day_index.pop(event_id, None)
+    flush_attendance_writes()
+    return event
+
+
+def event_day_add_attendee(event_id, user_id, name, surname, scanned=False):
+    """Добавляет гостя в индекс активного мероприятия (новый ответ 'Да' или скан мимо индекса)"""
+    with event_day_lock:
+        event = event_day_index.get(event_id)
+        if event is None:
+            return
+        attendee = event['attendees'].setdefault(
+            user_id, {'name': name, 'surname': surname, 'scanned': False}
+        )
+        attendee['scanned'] = attendee['scanned'] or scanned
+
+
+def event_day_update_name(user_id, name, surname):
+    """Обновляет имя гостя во всех активных мероприятиях"""
+    with event_day_lock:
+        for event in event_day_index.values():
+            attendee = event['attendees'].get(user_id)
+            if attendee:
+                attendee['name'] = name
+                attendee['surname'] = surname
+
+
+def check_in_from_index(event_id, user_id, bot_name="БОТ"):
+    """Отмечает гостя по индексу в памяти. None - мероприятие не активно или гостя нет в индексе"""
+    with event_day_lock:
+        event = event_day_index.get(event_id)
+        if event is None:
+            return None
+
+        attendee = event['attendees'].get(user_id)
+        if attendee is None:
+            return None
+
+        result = {
+            'event_id': event_id,
+            'user_id': user_id,
+            'name': attendee['name'],
+            'surname': attendee['surname'],
+            'event_name': event['event_name'],
+        }
+
+        if attendee['scanned']:
+            result['status'] = 'already_scanned'
+            return result
+
+        attendee['scanned'] = True
+        result['status'] = 'success'
+
+    if EVENT_DAY_SHARED:
+        # Гостя мог отметить другой процесс: решает условная запись в базу
+        result['status'] = mark_attendance(user_id, event['event_name'], event_id)
+        if result['status'] != 'success':
+            if result['status'] == 'error':
+                with event_day_lock:
+                    attendee['scanned'] = False
+            return result
+    else:
+        attendance_write_queue.put((user_id, event_id, event['event_name'], int(time.time())))
+    print(f"📱 [{bot_name}] Отсканирован: {attendee['name']} {attendee['surname']} на {event['event_name']}")
+    return result
+
+
+def attendance_writer():
+    """Фоновая запись отметок: все, что накопилось в очереди, - одной транзакцией"""
+    attendance_db = connect_db('attendance.db')
+    attendance_db.execute("ATTACH DATABASE 'responses.db' AS responses")
+    parked_attendance_writes.extend(load_parked_attendance_writes())
+
+    while True:
+        # Пока есть отложенные отметки, очередь ждем не дольше интервала повтора
+        try:
+            batch = [attendance_write_queue.get(
+                timeout=ATTENDANCE_RETRY_INTERVAL if parked_attendance_writes else None
+            )]
+        except queue.Empty:
+            batch = []
+        while True:
             try:
-                data, bbox, _ = qr_detector.detectAndDecode(processed_img)
-                if data and len(data) > 0:
-                    found_data.append((method_name, data))
-            except:
-                pass
+                batch.append(attendance_write_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            failed = write_attendance_with_retries(attendance_db, batch) if batch else []
+            if parked_attendance_writes:
+                failed = write_attendance_one_by_one(attendance_db, list(parked_attendance_writes),
+                                                     log=False) + failed
+            if failed or parked_attendance_writes:
+                if len(failed) != len(parked_attendance_writes):
+                    print(f"⚠️ Отложенных отметок: {len(failed)}")
+                parked_attendance_writes[:] = failed
+                save_parked_attendance_writes(failed)
+        finally:
+            for _ in batch:
+                attendance_write_queue.task_done()
+
+
+def write_attendance_with_retries(attendance_db, batch):
+    """Пишет пачку с повторами; возвращает отметки, которые так и не записались"""
+    for attempt in range(1, ATTENDANCE_WRITE_ATTEMPTS + 1):
+        try:
+            write_attendance_batch(attendance_db, batch)
+            return []
+        except Exception as e:
+            print(f"❌ Ошибка фоновой записи отметок ({len(batch)} шт.), "
+                  f"попытка {attempt}/{ATTENDANCE_WRITE_ATTEMPTS}: {e}")
+            if attempt < ATTENDANCE_WRITE_ATTEMPTS:
+                time.sleep(2 ** (attempt - 1))
 
-        if found_data:
-            data_counts = {}
-            for _, data in found_data:
-                data_counts[data] = data_counts.get(data, 0) + 1
+    # Пачка так и не записалась - пишем по одной, чтобы одна плохая отметка не держала остальные
+    return write_attendance_one_by_one(attendance_db, batch)
 
-            most_common_data = max(data_counts.items(), key=lambda x: x[1])
-            return most_common_data[0]
 
+def write_attendance_batch(attendance_db, batch):
+    """Пишет пачку отметок и ответов 'Да' одной транзакцией"""
+    with attendance_db:
+        attendance_db.executemany(
+            MARK_ATTENDANCE_SQL,
+            [(user_id, event_name, scanned_at) for user_id, event_id, event_name, scanned_at in batch]
+        )
+        attendance_db.executemany(
+            MARK_RESPONSE_SQL,
+            [(user_id, event_id, scanned_at) for user_id, event_id, event_name, scanned_at in batch]
+        )
+
+
+def write_attendance_one_by_one(attendance_db, batch, log=True):
+    """По одной отметке; возвращает незаписанные"""
+    failed = []
+    for item in batch:
         try:
-            inverted = cv2.bitwise_not(img)
-            data, bbox, _ = qr_detector.detectAndDecode(inverted)
-            if data and len(data) > 0:
-                return data
-        except:
-            pass
+            write_attendance_batch(attendance_db, [item])
+        except Exception as e:
+            failed.append(item)
+            if log:
+                print(f"❌ Отметка не записана и отложена: {item}: {e}")
+    return failed
 
-        return None
 
+def load_parked_attendance_writes():
+    """Отложенные отметки из файла (user_id, event_id, event_name, scanned_at)"""
+    try:
+        with open(PARKED_ATTENDANCE_FILE, encoding='utf-8') as f:
+            return [tuple(json.loads(line)) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
     except Exception as e:
-        print(f"❌ Ошибка сканирования: {e}")
-        return None
+        print(f"❌ Ошибка чтения отложенных отметок: {e}")
+        return []
 
 
-def enhanced_qr_decode(file_path):
-    """УЛУЧШЕННАЯ функция сканирования QR-кодов с дополнительными методами"""
+def save_parked_attendance_writes(items):
+    """Сохраняет отложенные отметки; файл заменяется целиком, пустой список удаляет его"""
     try:
-        pil_img = Image.open(file_path)
+        if not items:
+            if os.path.exists(PARKED_ATTENDANCE_FILE):
+                os.remove(PARKED_ATTENDANCE_FILE)
+            return
 
-        methods = []
+        temp_path = f"{PARKED_ATTENDANCE_FILE}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for item in items:
+                f.write(json.dumps(list(item), ensure_ascii=False) + '\n')
+        os.replace(temp_path, PARKED_ATTENDANCE_FILE)
+    except Exception as e:
+        print(f"❌ Ошибка сохранения отложенных отметок: {e}")
 
-        img1 = pil_img.copy()
-        enhancer = ImageEnhance.Contrast(img1)
-        img1 = enhancer.enhance(2.0)
-        methods.append(("Высокий контраст", img1))
 
-        img2 = pil_img.copy()
-        enhancer = ImageEnhance.Sharpness(img2)
-        img2 = enhancer.enhance(3.0)
-        methods.append(("Высокая резкость", img2))
+def flush_attendance_writes(timeout=5):
+    """Ждет, пока фоновая запись отметок догонит очередь"""
+    deadline = time.monotonic() + timeout
+    while attendance_write_queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.05)
 
-        img3 = pil_img.copy()
-        img3 = ImageOps.grayscale(img3)
-        enhancer = ImageEnhance.Contrast(img3)
-        img3 = enhancer.enhance(3.0)
-        methods.append(("Черно-белый контраст", img3))
 
-        img4 = pil_img.copy()
-        if img4.mode == 'RGB':
-            img4 = ImageOps.invert(img4)
-        methods.append(("Инверсия цветов", img4))
+def activate_event_day(event_id):
+    """Включает режим дня мероприятия во всех процессах и загружает гостей в этом"""
+    if not get_event_info(event_id):
+        return None
+    with events_conn:
+        events_conn.execute('INSERT OR IGNORE INTO event_days (event_id) VALUES (?)', (event_id,))
+    return load_event_day(event_id)
 
-        img5 = pil_img.copy()
-        width, height = img5.size
-        img5 = img5.resize((width * 2, height * 2), Image.Resampling.LANCZOS)
-        methods.append(("Увеличенный размер", img5))
 
-        img6 = pil_img.copy()
-        img6 = ImageOps.autocontrast(img6, cutoff=2)
-        methods.append(("Автоконтраст", img6))
+def deactivate_event_day(event_id):
+    """Выключает режим дня мероприятия во всех процессах"""
+    with events_conn:
+        events_conn.execute('DELETE FROM event_days WHERE event_id = ?', (event_id,))
+    return unload_event_day(event_id)
 
-        qr_detector = cv2.QRCodeDetector()
 
-        for method_name, processed_img in methods:
-            try:
-                opencv_img = cv2.cvtColor(np.array(processed_img), cv2.COLOR_RGB2BGR)
+# Отметки мероприятия начиная с момента (scanned_at в секундах)
+EVENT_DAY_SCANS_SQL = '''
+    SELECT user_id FROM attendance
+    WHERE event_name = ? AND attendance_status = 1 AND scanned_at >= ?
+'''
+
+
+def sync_event_days():
+    """Сверяет мероприятия с таблицей event_days и подтягивает в индекс отметки других процессов"""
+    sync_db = connect_db('events.db')
+    scans_db = connect_db('attendance.db')
+    since = int(time.time())
+    while True:
+        started = int(time.time())
+        try:
+            active = {event_id for (event_id,) in sync_db.execute('SELECT event_id FROM event_days')}
+            with event_day_lock:
+                loaded = set(event_day_index)
+            for event_id in active - loaded:
+                load_event_day(event_id)
+            for event_id in loaded - active:
+                unload_event_day(event_id)
+            refresh_event_day_scans(scans_db, since)
+            # Секунда запаса: отметка могла записаться в ту же секунду, что и прошлый запрос
+            since = started - 1
+        except Exception as e:
+            print(f"❌ Ошибка синхронизации режима дня мероприятия: {e}")
+        time.sleep(EVENT_DAY_SYNC_INTERVAL)
+
 
-                data, bbox, _ = qr_detector.detectAndDecode(opencv_img)
-                if data and len(data) > 0:
-                    return data
+def refresh_event_day_scans(scans_db, since):
+    """Отмечает в индексе гостей, которых с момента since отметили в базе другие процессы"""
+    with event_day_lock:
+        events = [(event_id, event['event_name']) for event_id, event in event_day_index.items()]
 
-            except:
+    for event_id, event_name in events:
+        user_ids = [user_id for (user_id,) in scans_db.execute(EVENT_DAY_SCANS_SQL, (event_name, since))]
+        with event_day_lock:
+            event = event_day_index.get(event_id)
+            if event is None:
                 continue
+            for user_id in user_ids:
+                attendee = event['attendees'].get(user_id)
+                if attendee:
+                    attendee['scanned'] = True
 
-        combined_img = pil_img.copy()
-        width, height = combined_img.size
-        combined_img = combined_img.resize((width * 2, height * 2), Image.Resampling.LANCZOS)
-        combined_img = ImageOps.autocontrast(combined_img, cutoff=5)
-        enhancer = ImageEnhance.Sharpness(combined_img)
-        combined_img = enhancer.enhance(3.0)
 
-        try:
-            opencv_img = cv2.cvtColor(np.array(combined_img), cv2.COLOR_RGB2BGR)
-            data, bbox, _ = qr_detector.detectAndDecode(opencv_img)
-            if data and len(data) > 0:
-                return data
-        except:
-            pass
+def start_event_day():
+    """Фоновая запись отметок, мероприятия из EVENT_DAY_IDS и синхронизация с event_days"""
+    if not EVENT_DAY_INDEX:
+        return
 
-        return None
+    if not EVENT_DAY_SHARED:
+        threading.Thread(target=attendance_writer, daemon=True).start()
+        atexit.register(flush_attendance_writes)
 
-    except Exception as e:
-        print(f"❌ Ошибка в улучшенном сканировании: {e}")
-        return None
+    for event_id in EVENT_DAY_IDS.split(','):
+        if event_id.strip().isdigit():
+            activate_event_day(int(event_id))
 
+    threading.Thread(target=sync_event_days, daemon=True).start()
 
-def process_qr_photo(bot, message, bot_name="БОТ"):
-    """Обрабатывает фото с QR-кодом (универсальная функция для всех ботов)"""
+
+# ========== ФУНКЦИИ ДЛЯ СКАНИРОВАНИЯ QR-КОДОВ ==========
+# Групповой режим: отмечать всех участников, чьи QR-коды попали в один кадр
+QR_MULTI_SCAN = os.getenv('QR_MULTI_SCAN', '1') == '1'
+
+# Минимальная сторона (px) размера фото, с которого начинается сканирование.
+# Если код не найден, скачивается следующий, более крупный размер.
+QR_MIN_PHOTO_SIDE = int(os.getenv('QR_MIN_PHOTO_SIDE', '480'))
+
+# Видео: декодируется каждый N-й кадр, пока не истечет бюджет времени (мс)
+QR_VIDEO_FRAME_STRIDE = int(os.getenv('QR_VIDEO_FRAME_STRIDE', '5'))
+QR_VIDEO_TIME_BUDGET_MS = int(os.getenv('QR_VIDEO_TIME_BUDGET_MS', '8000'))
+
+# Bot API не отдает через getFile файлы больше 20 МБ
+MAX_DOWNLOAD_SIZE = 20 * 1024 * 1024
+
+QR_NOT_FOUND_TEXT = (
+    "❌ *QR-код не найден на фото!*\n\n"
+    "**Советы для лучшего сканирования:**\n"
+    "1. 📸 Сфотографируйте QR-код при хорошем освещении\n"
+    "2. 🔍 Убедитесь, что весь QR-код в кадре\n"
+    "3. 📱 Держите камеру прямо напротив QR-кода\n"
+    "4. 💡 Избегайте бликов и теней\n"
+    "5. 🎯 QR-код должен занимать большую часть кадра"
+)
+
+
+QR_VIDEO_NOT_FOUND_TEXT = (
+    "❌ *QR-коды в видео не найдены!*\n\n"
+    "**Советы для сканирования видео:**\n"
+    "1. 🐢 Ведите камерой медленно, задерживаясь на каждом QR-коде\n"
+    "2. 💡 Снимайте при хорошем освещении, без бликов\n"
+    "3. 🎯 QR-код должен занимать заметную часть кадра\n"
+    "4. ⏱ Короткие ролики обрабатываются быстрее"
+)
+
+
+def parse_qr_data(qr_data):
+    """Разбирает данные QR-кода '<мероприятие>U<пользователь>' (ValueError при ошибке)"""
+    event_id_str, user_id_str = qr_data.split('U')
+    return int(event_id_str), int(user_id_str)
+
+
+# Код билета, набранный вручную: '<мероприятие>U<пользователь>', буква U в любом регистре
+QR_TEXT_PATTERN = re.compile(r'\b(\d+)\s*[Uu]\s*(\d+)\b')
+
+
+def extract_qr_codes(text):
+    """Находит в тексте коды билетов и приводит их к виду данных QR-кода (без повторов)"""
+    codes = [f"{int(event_id)}U{int(user_id)}" for event_id, user_id in QR_TEXT_PATTERN.findall(text or '')]
+    return list(dict.fromkeys(codes))
+
+
+def check_in_attendee(event_id, user_id, bot_name="БОТ"):
+    """Проверяет участника и мероприятие и отмечает посещение"""
+    # В день мероприятия гость проверяется по индексу в памяти
+    result = check_in_from_index(event_id, user_id, bot_name)
+    if result:
+        return result
+
+    result = {'status': 'error', 'event_id': event_id, 'user_id': user_id}
+
+    # Проверяем пользователя
+    user_info = get_user_info(user_id)
+    if not user_info:
+        result['status'] = 'user_not_found'
+        return result
+
+    name, surname = user_info
+    result['name'] = name
+    result['surname'] = surname
+
+    # Проверяем мероприятие
+    event_info = get_event_info(event_id)
+    if not event_info:
+        result['status'] = 'event_not_found'
+        return result
+
+    event_name = event_info[0]
+    result['event_name'] = event_name
+
+    # Отмечаем посещение (статус 1) и создаем ответ 'Да', если его нет
+    attendance_result = mark_attendance(user_id, event_name, event_id)
+    result['status'] = attendance_result
+
+    if attendance_result == "success":
+        # Логируем сканирование
+        print(f"📱 [{bot_name}] Отсканирован: {name} {surname} на {event_name}")
+
+    if attendance_result in ("success", "already_scanned"):
+        event_day_add_attendee(event_id, user_id, name, surname, scanned=True)
+
+    return result
+
+
+def format_check_in_message(result):
+    """Сообщение с результатом отметки одного участника"""
+    status = result['status']
+    event_id = result['event_id']
+    user_id = result['user_id']
+
+    if status == 'user_not_found':
+        return (
+            f"❌ *Пользователь не найден!*\n\n"
+            f"ID пользователя: `{user_id}`\n\n"
+            f"Возможно, пользователь не зарегистрирован в системе."
+        )
+
+    if status == 'event_not_found':
+        return (
+            f"❌ *Мероприятие не найдено!*\n\n"
+            f"ID мероприятия: `{event_id}`\n\n"
+            f"Мероприятие с таким номером не существует."
+        )
+
+    name = result['name']
+    surname = result['surname']
+    event_name = result['event_name']
+
+    if status == "success":
+        return (
+            f"✅ *QR-код успешно отсканирован!*\n\n"
+            f"🎫 *Мероприятие:* {event_name} (№{event_id})\n"
+            f"👤 *Участник:* {name} {surname}\n"
+            f"🆔 *ID:* {user_id}\n\n"
+            f"✅ *Посещение отмечено!*"
+        )
+
+    if status == "already_scanned":
+        return (
+            f"⚠️ *Этот QR-код уже был отсканирован!*\n\n"
+            f"🎫 *Мероприятие:* {event_name} (№{event_id})\n"
+            f"👤 *Участник:* {name} {surname}\n"
+            f"🆔 *ID:* {user_id}\n\n"
+            f"❌ Этот участник уже был зарегистрирован."
+        )
+
+    return (
+        f"❌ *Ошибка отметки посещения!*\n\n"
+        f"🎫 Мероприятие: {event_name} (№{event_id})\n"
+        f"👤 Участник: {name} {surname}\n"
+        f"🆔 ID: {user_id}"
+    )
+
+
+def handle_qr_data(bot, chat_id, qr_data, bot_name="БОТ"):
+    """Отмечает посещение по одному QR-коду и отвечает подробным сообщением"""
+    # Проверяем формат с разделителем 'U'
+    if 'U' not in qr_data:
+        bot.send_message(chat_id,
+                         f"❌ *Неверный формат QR-кода!*\n\n"
+                         f"Получено: `{qr_data}`\n\n"
+                         f"Ожидался формат: номер мероприятияUid пользователя\n"
+                         f"Пример: `1U123456789`\n\n"
+                         f"Проверьте правильность QR-кода.",
+                         parse_mode='Markdown')
+        return
+
+    # Разделяем на номер мероприятия и ID пользователя
     try:
-        bot.send_message(message.chat.id, "🔍 Сканирую QR-код...")
+        event_id, user_id = parse_qr_data(qr_data)
+        result = check_in_attendee(event_id, user_id, bot_name)
+        bot.send_message(chat_id, format_check_in_message(result), parse_mode='Markdown')
 
-        # Скачиваем фото
-        file_id = message.photo[-1].file_id
-        file_info = bot.get_file(file_id)
-        downloaded_file = bot.download_file(file_info.file_path)
+    except ValueError:
+        bot.send_message(chat_id,
+                         f"❌ *Ошибка обработки QR-кода!*\n\n"
+                         f"Получено: `{qr_data}`\n\n"
+                         f"Некорректные данные в QR-коде.\n"
+                         f"Ожидался формат: `числоUчисло`\n"
+                         f"Пример: `1U123456789`",
+                         parse_mode='Markdown')
+    except Exception as e:
+        print(f"❌ [{bot_name}] Ошибка обработки QR: {e}")
+        bot.send_message(chat_id,
+                         f"❌ *Ошибка обработки!*\n\n"
+                         f"Подробности: {str(e)[:100]}\n\n"
+                         f"Попробуйте снова.",
+                         parse_mode='Markdown')
+
+
+def check_in_group(payloads, bot_name="БОТ"):
+    """Отмечает посещение по каждому QR-коду из списка"""
+    results = []
+    for qr_data in payloads:
+        try:
+            event_id, user_id = parse_qr_data(qr_data)
+        except ValueError:
+            results.append({'status': 'invalid', 'qr_data': qr_data})
+            continue
 
-        # Сохраняем временный файл
-        temp_file = f"temp_qr_{message.message_id}.jpg"
-        with open(temp_file, 'wb') as f:
-            f.write(downloaded_file)
+        try:
+            result = check_in_attendee(event_id, user_id, bot_name)
+        except Exception as e:
+            print(f"❌ [{bot_name}] Ошибка обработки QR {qr_data}: {e}")
+            result = {'status': 'error', 'event_id': event_id, 'user_id': user_id}
+
+        result['qr_data'] = qr_data
+        results.append(result)
+
+    return results
+
+
+def format_group_check_in_message(results):
+    """Сводное сообщение по групповой отметке"""
+    lines = [f"👥 *Групповая отметка: {len(results)} QR-код(ов)*\n"]
+    counts = {'success': 0, 'already_scanned': 0, 'failed': 0}
+
+    for result in results:
+        status = result['status']
+        if status == 'success':
+            counts['success'] += 1
+            lines.append(f"✅ {result['name']} {result['surname']} - {result['event_name']} (№{result['event_id']})")
+        elif status == 'already_scanned':
+            counts['already_scanned'] += 1
+            lines.append(f"⚠️ {result['name']} {result['surname']} - уже был отсканирован")
+        else:
+            counts['failed'] += 1
+            reason = {
+                'invalid': 'неверный формат',
+                'user_not_found': 'пользователь не найден',
+                'event_not_found': 'мероприятие не найдено',
+            }.get(status, 'ошибка отметки')
+            lines.append(f"❌ `{result['qr_data']}` - {reason}")
+
+    lines.append(
+        f"\n📊 *Итого:* ✅ {counts['success']}  ⚠️ {counts['already_scanned']}  ❌ {counts['failed']}"
+    )
+    return "\n".join(lines)
+
+
+def send_check_in_results(bot, chat_id, payloads, bot_name="БОТ", not_found_text=QR_NOT_FOUND_TEXT):
+    """Отмечает посещение по найденным QR-кодам и отправляет один ответ"""
+    if len(payloads) == 1:
+        handle_qr_data(bot, chat_id, payloads[0], bot_name)
+    elif payloads:
+        results = check_in_group(payloads, bot_name)
+        bot.send_message(chat_id,
+                         format_group_check_in_message(results),
+                         parse_mode='Markdown')
+    else:
+        bot.send_message(chat_id, not_found_text, parse_mode='Markdown')
+
+
+def get_scan_photo_sizes(photos):
+    """Размеры фото для сканирования: от наименьшего подходящего до самого большого"""
+    photos = sorted(photos, key=lambda photo: photo.width * photo.height)
+
+    for index, photo in enumerate(photos):
+        if min(photo.width, photo.height) >= QR_MIN_PHOTO_SIDE:
+            return photos[index:]
+
+    return photos[-1:]
+
+
+def scan_photo_size(bot, photo_size, multi, filters=None, deadline=None):
+    """Скачивает один размер фото и ищет на нем QR-коды"""
+    file_info = bot.get_file(photo_size.file_id)
+    downloaded_file = bot.download_file(file_info.file_path)
 
-        # Сканируем QR-код
-        qr_data = decode_qr_code_from_photo(temp_file)
+    # Сохраняем временный файл: message_id повторяется в разных чатах,
+    # поэтому имя выдает mkstemp
+    fd, temp_file = tempfile.mkstemp(prefix='temp_qr_', suffix='.jpg')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(downloaded_file)
 
-        # Дополнительная проверка если не найден
-        if not qr_data:
-            qr_data = enhanced_qr_decode(temp_file)
+        # Сканируем QR-код (движки из QR_DECODER_BACKENDS, затем фильтры)
+        if multi:
+            return load_qr_utils().decode_qr_payloads(temp_file, filters=filters, deadline=deadline)
 
+        qr_data = load_qr_utils().decode_qr_payload(temp_file, filters=filters, deadline=deadline)
+        return [qr_data] if qr_data else []
+    finally:
         # Удаляем временные файлы
         if os.path.exists(temp_file):
             os.remove(temp_file)
 
-        if qr_data:
-            # Проверяем формат с разделителем 'U'
-            if 'U' not in qr_data:
-                bot.send_message(message.chat.id,
-                                 f"❌ *Неверный формат QR-кода!*\n\n"
-                                 f"Получено: `{qr_data}`\n\n"
-                                 f"Ожидался формат: номер мероприятияUid пользователя\n"
-                                 f"Пример: `1U123456789`\n\n"
-                                 f"Проверьте правильность QR-кода.",
-                                 parse_mode='Markdown')
-                return
-
-            # Разделяем на номер мероприятия и ID пользователя
-            try:
-                event_id_str, user_id_str = qr_data.split('U')
-                event_id = int(event_id_str)
-                user_id = int(user_id_str)
-
-                # Проверяем пользователя
-                user_info = get_user_info(user_id)
-
-                if not user_info:
-                    bot.send_message(message.chat.id,
-                                     f"❌ *Пользователь не найден!*\n\n"
-                                     f"ID пользователя: `{user_id}`\n\n"
-                                     f"Возможно, пользователь не зарегистрирован в системе.",
-                                     parse_mode='Markdown')
-                    return
-
-                name, surname = user_info
-
-                # Проверяем мероприятие
-                event_info = get_event_info(event_id)
-
-                if not event_info:
-                    bot.send_message(message.chat.id,
-                                     f"❌ *Мероприятие не найдено!*\n\n"
-                                     f"ID мероприятия: `{event_id}`\n\n"
-                                     f"Мероприятие с таким номером не существует.",
-                                     parse_mode='Markdown')
-                    return
-
-                event_name = event_info[0]
-
-                # Проверяем, есть ли уже запись о посещении
-                attendance_cursor.execute('''
-                    SELECT attendance_status FROM attendance 
-                    WHERE user_id = ? AND event_name = ?
-                ''', (user_id, event_name))
-
-                attendance_record = attendance_cursor.fetchone()
-
-                if attendance_record and attendance_record[0] == 1:
-                    bot.send_message(message.chat.id,
-                                     f"⚠️ *Этот QR-код уже был отсканирован!*\n\n"
-                                     f"🎫 *Мероприятие:* {event_name}\n"
-                                     f"👤 *Участник:* {name} {surname}\n"
-                                     f"🆔 *ID:* {user_id}\n\n"
-                                     f"❌ Этот участник уже был зарегистрирован.",
-                                     parse_mode='Markdown')
-                    return
-
-                # Отмечаем посещение (статус 1)
-                attendance_result = mark_attendance(user_id, event_name)
-
-                if attendance_result == "success":
-                    response = (
-                        f"✅ *QR-код успешно отсканирован!*\n\n"
-                        f"🎫 *Мероприятие:* {event_name} (№{event_id})\n"
-                        f"👤 *Участник:* {name} {surname}\n"
-                        f"🆔 *ID:* {user_id}\n\n"
-                        f"✅ *Посещение отмечено!*"
-                    )
-
-                    # Логируем сканирование
-                    print(f"📱 [{bot_name}] Отсканирован: {name} {surname} на {event_name}")
-
-                    # Создаем запись в user_responses если её нет
-                    responses_cursor.execute('''
-                        SELECT response FROM user_responses 
-                        WHERE user_id = ? AND event_id = ?
-                    ''', (user_id, event_id))
-
-                    if not responses_cursor.fetchone():
-                        responses_cursor.execute(
-                            'INSERT OR REPLACE INTO user_responses (user_id, event_id, response, qr_sent) VALUES (?, ?, ?, 1)',
-                            (user_id, event_id, 'yes', 1)
-                        )
-                        responses_conn.commit()
-
-                elif attendance_result == "already_scanned":
-                    response = (
-                        f"⚠️ *Этот QR-код уже был отсканирован!*\n\n"
-                        f"🎫 *Мероприятие:* {event_name} (№{event_id})\n"
-                        f"👤 *Участник:* {name} {surname}\n"
-                        f"🆔 *ID:* {user_id}\n\n"
-                        f"❌ Этот участник уже был зарегистрирован."
-                    )
-                else:
-                    response = (
-                        f"❌ *Ошибка отметки посещения!*\n\n"
-                        f"🎫 Мероприятие: {event_name} (№{event_id})\n"
-                        f"👤 Участник: {name} {surname}\n"
-                        f"🆔 ID: {user_id}"
-                    )
-
-                bot.send_message(message.chat.id, response, parse_mode='Markdown')
-
-            except ValueError:
-                bot.send_message(message.chat.id,
-                                 f"❌ *Ошибка обработки QR-кода!*\n\n"
-                                 f"Получено: `{qr_data}`\n\n"
-                                 f"Некорректные данные в QR-коде.\n"
-                                 f"Ожидался формат: `числоUчисло`\n"
-                                 f"Пример: `1U123456789`",
-                                 parse_mode='Markdown')
-            except Exception as e:
-                print(f"❌ [{bot_name}] Ошибка обработки QR: {e}")
-                bot.send_message(message.chat.id,
-                                 f"❌ *Ошибка обработки!*\n\n"
-                                 f"Подробности: {str(e)[:100]}\n\n"
-                                 f"Попробуйте снова.",
-                                 parse_mode='Markdown')
 
-        else:
-            bot.send_message(message.chat.id,
-                             "❌ *QR-код не найден на фото!*\n\n"
-                             "**Советы для лучшего сканирования:**\n"
-                             "1. 📸 Сфотографируйте QR-код при хорошем освещении\n"
-                             "2. 🔍 Убедитесь, что весь QR-код в кадре\n"
-                             "3. 📱 Держите камеру прямо напротив QR-кода\n"
-                             "4. 💡 Избегайте бликов и теней\n"
-                             "5. 🎯 QR-код должен занимать большую часть кадра",
-                             parse_mode='Markdown')
+def scan_message_photo(bot, message, multi, on_scan_start=None):
+    """Находит QR-коды на фото из сообщения: сначала кеш, затем скачивание.
+    Возвращает (коды, взяты_из_кеша); on_scan_start вызывается перед скачиванием"""
+    # Это фото уже сканировали - сразу возвращаем результат
+    photo_key = message.photo[-1].file_unique_id
+    payloads = get_cached_qr_payloads(photo_key, multi)
+    if payloads is not None:
+        return payloads, True
+
+    if on_scan_start:
+        on_scan_start()
+
+    # Бюджет времени на все сканирование: плохое фото быстро получает
+    # ответ "не найдено", и очередь у входа не стоит
+    qr_utils = load_qr_utils()
+    deadline = qr_utils.make_deadline()
+
+    # Начинаем со среднего размера фото и переходим к крупным, только если
+    # код не найден. Перебор фильтров - лишь на самом большом размере.
+    payloads = []
+    photo_sizes = get_scan_photo_sizes(message.photo)
+    for index, photo_size in enumerate(photo_sizes):
+        if index and not qr_utils.time_left(deadline):
+            print(f"⏱ Бюджет сканирования исчерпан (фото {message.message_id})")
+            break
+
+        is_largest = index == len(photo_sizes) - 1
+        payloads = scan_photo_size(bot, photo_size, multi,
+                                   filters=None if is_largest else False,
+                                   deadline=deadline)
+        if payloads:
+            break
+
+    if payloads:
+        cache_qr_payloads(photo_key, multi, payloads)
+    return payloads, False
+
+
+def process_qr_photo(bot, message, bot_name="БОТ", multi=None):
+    """Обрабатывает фото с QR-кодом (универсальная функция для всех ботов)"""
+    if multi is None:
+        multi = QR_MULTI_SCAN
+
+    try:
+        payloads, cached = scan_message_photo(
+            bot, message, multi,
+            on_scan_start=lambda: bot.send_message(message.chat.id, "🔍 Сканирую QR-код...")
+        )
+        if cached:
+            print(f"⚡ [{bot_name}] QR-коды фото {message.message_id} взяты из кеша")
+
+        send_check_in_results(bot, message.chat.id, payloads, bot_name)
 
     except Exception as e:
         print(f"❌ [{bot_name}] Критическая ошибка: {e}")
@@ -600,6 +1230,152 @@ def process_qr_photo(bot, message, bot_name="БОТ"):
         )
 
 
+def process_qr_video(bot, message, bot_name="БОТ"):
+    """Обрабатывает видео или видеосообщение: отмечает всех, чьи QR-коды попали в кадр"""
+    media = message.video or message.video_note
+
+    try:
+        if media.file_size and media.file_size > MAX_DOWNLOAD_SIZE:
+            bot.send_message(message.chat.id,
+                             "❌ *Видео слишком большое!*\n\n"
+                             "Telegram позволяет ботам скачивать файлы до 20 МБ.\n"
+                             "Снимите ролик покороче.",
+                             parse_mode='Markdown')
+            return
+
+        payloads = get_cached_qr_payloads(media.file_unique_id, True)
+
+        if payloads is None:
+            bot.send_message(message.chat.id, "🎥 Сканирую видео...")
+
+            file_info = bot.get_file(media.file_id)
+            downloaded_file = bot.download_file(file_info.file_path)
+
+            # VideoCapture читает только из файла; имя уникально для всех чатов
+            fd, temp_file = tempfile.mkstemp(prefix='temp_qr_', suffix='.mp4')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(downloaded_file)
+
+                payloads = load_qr_utils().decode_qr_video(temp_file, QR_VIDEO_FRAME_STRIDE, QR_VIDEO_TIME_BUDGET_MS)
+            finally:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+
+            if payloads:
+                cache_qr_payloads(media.file_unique_id, True, payloads)
+
+        print(f"🎥 [{bot_name}] В видео найдено QR-кодов: {len(payloads)}")
+        send_check_in_results(bot, message.chat.id, payloads, bot_name, QR_VIDEO_NOT_FOUND_TEXT)
+
+    except Exception as e:
+        print(f"❌ [{bot_name}] Критическая ошибка при обработке видео: {e}")
+        bot.send_message(
+            message.chat.id,
+            "❌ *Произошла ошибка при обработке видео!*\n\n"
+            "Попробуйте отправить видео еще раз.",
+            parse_mode='Markdown'
+        )
+
+
+# ========== АЛЬБОМЫ ФОТО ==========
+# Фото одного альбома приходят отдельными сообщениями с общим media_group_id.
+# Собираем их, пока новые фото не перестанут приходить ALBUM_COLLECT_DELAY секунд.
+# Готовые альбомы уходят в пул сканера, в очередь своего чата.
+ALBUM_COLLECT_DELAY = float(os.getenv('ALBUM_COLLECT_DELAY', '1.0'))
+
+pending_albums = {}
+pending_albums_lock = threading.Lock()
+album_wakeup = threading.Event()
+
+
+def collect_album_photo(bot, message, bot_name="БОТ"):
+    """Добавляет фото в альбом и откладывает его обработку до прихода всех фото"""
+    key = (message.chat.id, message.media_group_id)
+
+    with pending_albums_lock:
+        album = pending_albums.setdefault(key, {'messages': [], 'bot': bot, 'bot_name': bot_name})
+        album['messages'].append(message)
+        album['due'] = time.monotonic() + ALBUM_COLLECT_DELAY
+    album_wakeup.set()
+
+
+def album_dispatcher():
+    """Один поток на все альбомы: отдает на сканирование те, к которым фото больше не приходят"""
+    while True:
+        album_wakeup.clear()
+        now = time.monotonic()
+        with pending_albums_lock:
+            ready = [(key, pending_albums.pop(key)) for key, album in list(pending_albums.items())
+                     if album['due'] <= now]
+            next_due = min((album['due'] for album in pending_albums.values()), default=None)
+
+        for key, album in ready:
+            if not update_pools['scanner'].submit(key[0], process_qr_album, album['bot'], key,
+                                                  album['messages'], album['bot_name']):
+                # Очередь чата переполнена - вернем альбом и попробуем позже
+                with pending_albums_lock:
+                    pending = pending_albums.setdefault(key, {'messages': [], 'bot': album['bot'],
+                                                              'bot_name': album['bot_name']})
+                    pending['messages'][:0] = album['messages']
+                    pending['due'] = time.monotonic() + ALBUM_COLLECT_DELAY
+                album_wakeup.set()
+
+        album_wakeup.wait(None if next_due is None else next_due - now)
+
+
+def start_album_dispatcher():
+    """Поток, который отдает собранные альбомы на сканирование"""
+    threading.Thread(target=album_dispatcher, name='album_dispatcher', daemon=True).start()
+
+
+def process_qr_album(bot, key, messages, bot_name="БОТ"):
+    """Сканирует все фото альбома параллельно и отправляет один сводный отчет"""
+    chat_id = key[0]
+    messages = sorted(messages, key=lambda message: message.message_id)
+
+    try:
+        bot.send_message(chat_id, f"🔍 Сканирую альбом: {len(messages)} фото...")
+
+        # Скачивание и декодирование идут параллельно для всех фото альбома
+        futures = [task_pools['album'].submit(scan_message_photo, bot, message, True)
+                   for message in messages]
+
+        payloads = []
+        photos_without_codes = 0
+        for future in futures:
+            try:
+                found, _ = future.result()
+            except Exception as e:
+                print(f"❌ [{bot_name}] Ошибка сканирования фото альбома: {e}")
+                found = []
+
+            if not found:
+                photos_without_codes += 1
+            payloads.extend(data for data in found if data not in payloads)
+
+        print(f"🖼 [{bot_name}] Альбом из {len(messages)} фото, найдено QR-кодов: {len(payloads)}")
+
+        if not payloads:
+            bot.send_message(chat_id, QR_NOT_FOUND_TEXT, parse_mode='Markdown')
+            return
+
+        report = format_group_check_in_message(check_in_group(payloads, bot_name))
+        if photos_without_codes:
+            report += f"\n📷 *Фото без QR-кода:* {photos_without_codes} из {len(messages)}"
+
+        bot.send_message(chat_id, report, parse_mode='Markdown')
+
+    except Exception as e:
+        print(f"❌ [{bot_name}] Критическая ошибка при обработке альбома: {e}")
+        bot.send_message(
+            chat_id,
+            "❌ *Произошла ошибка при обработке альбома!*\n\n"
+            "Попробуйте отправить фото еще раз.",
+            parse_mode='Markdown'
+        )
+
+
 # ========== ОПТИМИЗИРОВАННЫЕ ФУНКЦИИ РАССЫЛКИ ==========
 def send_invitation_to_user_optimized(args):
     """Оптимизированная функция отправки приглашения (для многопоточности)"""
@@ -711,9 +1487,6 @@ def start_broadcast(chat_id, event_num, event_name, invitation_text, event_photo
     admin_bot.send_message(chat_id, stats_message, reply_markup=admin_keyboard)
     print(f"✅ Рассылка завершена: {sent} отправлено, {failed} ошибок")
 
-    if hasattr(admin_bot, 'user_data') and chat_id in admin_bot.user_data:
-        del admin_bot.user_data[chat_id]
-
 
 def send_broadcast_message(user_id, message):
     """Отправляет одно сообщение пользователю"""
@@ -762,15 +1535,6 @@ def broadcast_message_to_all(chat_id, message_text):
 
 
 # ========== ФУНКЦИИ ДЛЯ СТАТИСТИКИ ==========
-def get_event_by_name(event_name):
-    """Находит мероприятие по точному названию"""
-    events_cursor.execute(
-        'SELECT event_id, event_name FROM events WHERE event_name = ?',
-        (event_name,)
-    )
-    return events_cursor.fetchone()
-
-
 def get_invitation_stats(event_id):
     """Получает статистику по приглашениям для мероприятия"""
     users_cursor.execute('SELECT COUNT(*) FROM users')
@@ -857,10 +1621,497 @@ def get_attendance_stats(event_id, event_name):
         return None
 
 
-# ========== ПОЛЬЗОВАТЕЛЬСКИЙ БОТ ==========
-user_data = {}
+# ========== ВЫБОР МЕРОПРИЯТИЯ КНОПКАМИ ==========
+EVENT_PICKER_PAGE_SIZE = int(os.getenv('EVENT_PICKER_PAGE_SIZE', '8'))
+
+
+def get_events_page(before_id=None, limit=EVENT_PICKER_PAGE_SIZE):
+    """Страница мероприятий от новых к старым (keyset по event_id). Возвращает (события, есть ли еще)"""
+    if before_id:
+        events_cursor.execute(
+            'SELECT event_id, event_name FROM events WHERE event_id < ? ORDER BY event_id DESC LIMIT ?',
+            (before_id, limit + 1)
+        )
+    else:
+        events_cursor.execute(
+            'SELECT event_id, event_name FROM events ORDER BY event_id DESC LIMIT ?',
+            (limit + 1,)
+        )
+    events = events_cursor.fetchall()
+    return events[:limit], len(events) > limit
+
+
+def create_event_picker(kind, before_id=None):
+    """Инлайн-клавиатура выбора мероприятия. None - мероприятий нет"""
+    events, has_more = get_events_page(before_id)
+    if not events:
+        return None
+
+    keyboard = types.InlineKeyboardMarkup(row_width=1)
+    for event_id, event_name in events:
+        title = event_name if len(event_name) <= 40 else event_name[:39] + "…"
+        keyboard.add(types.InlineKeyboardButton(f"{title} (№{event_id})",
+                                                callback_data=f"pick_{kind}_{event_id}"))
+
+    navigation = []
+    if before_id:
+        navigation.append(types.InlineKeyboardButton("⏮ К новым", callback_data=f"pickpage_{kind}_0"))
+    if has_more:
+        navigation.append(types.InlineKeyboardButton("Старше ▶️", callback_data=f"pickpage_{kind}_{events[-1][0]}"))
+    if navigation:
+        keyboard.row(*navigation)
+
+    return keyboard
+
+
+# ========== СВОДКА ПО ВСЕМ МЕРОПРИЯТИЯМ ==========
+DASHBOARD_PAGE_SIZE = int(os.getenv('DASHBOARD_PAGE_SIZE', '5'))
+
+dashboard_conn = open_readonly_connection()
+dashboard_lock = threading.Lock()
+# Сводка пересчитывается, только если в какую-то из баз что-то записали
+dashboard_cache = {'version': None, 'data': None}
+
+
+def get_data_version(conn):
+    """Версия данных всех баз: PRAGMA data_version меняется после каждой записи из других соединений"""
+    return tuple(
+        conn.execute(f'PRAGMA {schema}.data_version').fetchone()[0]
+        for schema in ('main', 'users', 'responses', 'attendance')
+    )
+
+
+def get_dashboard_stats():
+    """Приглашено, да, нет, QR отправлен и пришли - по всем мероприятиям, по запросу на таблицу"""
+    with dashboard_lock:
+        version = get_data_version(dashboard_conn)
+        if dashboard_cache['version'] == version:
+            return dashboard_cache['data']
+
+        total_users = dashboard_conn.execute('SELECT COUNT(*) FROM users.users').fetchone()[0]
+
+        invited = dict(dashboard_conn.execute(
+            'SELECT event_id, COUNT(DISTINCT user_id) FROM responses.invitation_messages GROUP BY event_id'
+        ))
+
+        answers = {row[0]: row[1:] for row in dashboard_conn.execute('''
+            SELECT event_id, SUM(response = 'yes'), SUM(response = 'no'), SUM(qr_sent)
+            FROM responses.user_responses GROUP BY event_id
+        ''')}
+
+        attended = dict(dashboard_conn.execute(
+            'SELECT event_name, SUM(attendance_status = 1) FROM attendance.attendance GROUP BY event_name'
+        ))
+
+        events = []
+        for event_id, event_name in dashboard_conn.execute(
+                'SELECT event_id, event_name FROM events ORDER BY event_id DESC'):
+            yes_count, no_count, qr_sent = answers.get(event_id, (0, 0, 0))
+            events.append({
+                'event_id': event_id,
+                'event_name': event_name,
+                'invited': invited.get(event_id, 0),
+                'yes': yes_count or 0,
+                'no': no_count or 0,
+                'qr_sent': qr_sent or 0,
+                'attended': attended.get(event_name) or 0,
+            })
+
+        data = {'total_users': total_users, 'events': events}
+        dashboard_cache['version'] = version
+        dashboard_cache['data'] = data
+        return data
+
+
+def format_dashboard_page(data, page):
+    """Одна страница сводки и клавиатура для перелистывания"""
+    events = data['events']
+    pages = max(1, (len(events) + DASHBOARD_PAGE_SIZE - 1) // DASHBOARD_PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+
+    lines = [
+        f"📈 *Сводка по мероприятиям* (стр. {page + 1}/{pages})\n",
+        f"👥 *Пользователей в системе:* {data['total_users']}\n",
+    ]
+
+    for event in events[page * DASHBOARD_PAGE_SIZE:(page + 1) * DASHBOARD_PAGE_SIZE]:
+        lines.append(
+            f"🎫 *{event['event_name']}* (№{event['event_id']})\n"
+            f"📨 {event['invited']} · ✅ {event['yes']} · ❌ {event['no']} · "
+            f"📱 {event['qr_sent']} · 🎯 {event['attended']}\n"
+        )
+
+    if not events:
+        lines.append("Мероприятий пока нет\n")
+
+    lines.append("_📨 приглашено · ✅ да · ❌ нет · 📱 QR отправлен · 🎯 пришли_")
+
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    buttons = []
+    if page > 0:
+        buttons.append(types.InlineKeyboardButton("◀️ Назад", callback_data=f"dashboard_{page - 1}"))
+    if page < pages - 1:
+        buttons.append(types.InlineKeyboardButton("Вперед ▶️", callback_data=f"dashboard_{page + 1}"))
+    if buttons:
+        keyboard.add(*buttons)
+
+    return "\n".join(lines), keyboard
+
+
+# ========== ВЫГРУЗКА ДАННЫХ ==========
+# Файл выгрузки держится в памяти до этого размера, дальше - во временном файле на диске
+EXPORT_SPOOL_SIZE = int(os.getenv('EXPORT_SPOOL_SIZE', str(1024 * 1024)))
+
+# Строк за один запрос: каждая порция читается короткой транзакцией, между порциями
+# база свободна для отметок на входе
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '500'))
+
+EXPORT_COLUMNS = ['Номер мероприятия', 'Мероприятие', 'Telegram ID', 'Имя', 'Фамилия',
+                  'Приглашение отправлено', 'Ответ', 'QR-код отправлен', 'Пришел']
+
+# Пользователи мероприятия, у которых было приглашение, ответ или отметка:
+# порция по EXPORT_CHUNK_SIZE после user_id предыдущей порции
+EXPORT_SQL = '''
+    WITH pairs AS (
+        SELECT user_id FROM responses.invitation_messages WHERE event_id = :event_id AND user_id > :after
+        UNION
+        SELECT user_id FROM responses.user_responses WHERE event_id = :event_id AND user_id > :after
+        UNION
+        SELECT user_id FROM attendance.attendance WHERE event_name = :event_name AND user_id > :after
+    )
+    SELECT p.user_id, u.name, u.surname,
+           im.message_id IS NOT NULL, r.response, r.qr_sent, a.attendance_status
+    FROM pairs p
+    LEFT JOIN users.users u ON u.telegram_id = p.user_id
+    LEFT JOIN responses.invitation_messages im ON im.user_id = p.user_id AND im.event_id = :event_id
+    LEFT JOIN responses.user_responses r ON r.user_id = p.user_id AND r.event_id = :event_id
+    LEFT JOIN attendance.attendance a ON a.user_id = p.user_id AND a.event_name = :event_name
+    ORDER BY p.user_id
+    LIMIT :limit
+'''
+
+
+def load_openpyxl():
+    """openpyxl загружается только для XLSX-выгрузки; None, если пакет не установлен"""
+    try:
+        import openpyxl
+    except ImportError:  # XLSX-выгрузка необязательна, CSV работает всегда
+        return None
+    return openpyxl
+
+
+def iter_export_rows(event_id=None):
+    """Строки выгрузки по одной (None - все мероприятия)
+
+    Каждая порция выбирается целиком отдельным запросом, поэтому блокировка чтения
+    не держится, пока строки пишутся в файл и отправляются.
+    """
+    conn = open_readonly_connection()
+    try:
+        events = conn.execute(
+            'SELECT event_id, event_name FROM events WHERE ? IS NULL OR event_id = ? ORDER BY event_id',
+            (event_id, event_id)
+        ).fetchall()
+
+        for row_event_id, event_name in events:
+            after = 0
+            while True:
+                chunk = conn.execute(EXPORT_SQL, {
+                    'event_id': row_event_id, 'event_name': event_name,
+                    'after': after, 'limit': EXPORT_CHUNK_SIZE,
+                }).fetchall()
+
+                for user_id, name, surname, invited, response, qr_sent, attended in chunk:
+                    yield [
+                        row_event_id, event_name, user_id, name or '', surname or '',
+                        'Да' if invited else 'Нет',
+                        {'yes': 'Да', 'no': 'Нет'}.get(response, 'Нет ответа'),
+                        'Да' if qr_sent else 'Нет',
+                        'Да' if attended == 1 else 'Нет',
+                    ]
+
+                if len(chunk) < EXPORT_CHUNK_SIZE:
+                    break
+                after = chunk[-1][0]
+    finally:
+        conn.close()
+
+
+def write_export_csv(rows, output):
+    """CSV в кодировке, которую Excel открывает без вопросов"""
+    # codecs-обертка пишет байты в любой файловый объект (TextIOWrapper поверх
+    # SpooledTemporaryFile работает только с Python 3.11)
+    text_output = codecs.getwriter('utf-8-sig')(output)
+    writer = csv.writer(text_output, delimiter=';')
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def write_export_xlsx(rows, output):
+    """XLSX в потоковом режиме openpyxl: строки не копятся в памяти"""
+    workbook = load_openpyxl().Workbook(write_only=True)
+    sheet = workbook.create_sheet('Посещаемость')
+    sheet.append(EXPORT_COLUMNS)
+    count = 0
+    for row in rows:
+        sheet.append(row)
+        count += 1
+    workbook.save(output)
+    return count
+
+
+def build_export(event_id=None, file_format='csv'):
+    """Собирает файл выгрузки. Возвращает (файл, число строк)"""
+    output = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    writer = write_export_xlsx if file_format == 'xlsx' else write_export_csv
+    try:
+        count = writer(iter_export_rows(event_id), output)
+    except Exception:
+        output.close()
+        raise
+    output.seek(0)
+    return output, count
+
+
+# ========== АНАЛИТИКА ПО ВРЕМЕНИ ==========
+# Число событий по минутам: {'arrivals': сканы на входе, 'responses': ответы на приглашение}
+TIMELINE_SQL = {
+    'arrivals': '''
+        SELECT a.scanned_at / 60, COUNT(*) FROM attendance.attendance a
+        JOIN events e ON e.event_name = a.event_name
+        WHERE e.event_id = ? AND a.attendance_status = 1 AND a.scanned_at IS NOT NULL
+        GROUP BY 1 ORDER BY 1
+    ''',
+    'responses': '''
+        SELECT responded_at / 60, COUNT(*) FROM responses.user_responses
+        WHERE event_id = ? AND responded_at IS NOT NULL
+        GROUP BY 1 ORDER BY 1
+    ''',
+}
+
+# Больше столбцов на картинке не помещается: соседние минуты объединяются
+HISTOGRAM_MAX_BARS = 60
+HISTOGRAM_MIN_BARS = 15
+
+
+def get_timeline(kind, event_id):
+    """Число событий по минутам: [(минута в unix-времени / 60, количество), ...]"""
+    conn = open_readonly_connection()
+    try:
+        return conn.execute(TIMELINE_SQL[kind], (event_id,)).fetchall()
+    finally:
+        conn.close()
+
+
+def bucket_timeline(timeline, max_bars=HISTOGRAM_MAX_BARS):
+    """Плотный ряд без пропусков. Возвращает (первая минута, минут в столбце, counts)"""
+    import numpy as np
+
+    minutes = np.array([minute for minute, _ in timeline], dtype=np.int64)
+    counts = np.array([count for _, count in timeline], dtype=np.int64)
+
+    first = int(minutes[0])
+    span = int(minutes[-1]) - first + 1
+    bucket = max(1, -(-span // max_bars))
+
+    bars = np.zeros(-(-span // bucket), dtype=np.int64)
+    np.add.at(bars, (minutes - first) // bucket, counts)
+    return first, bucket, bars
+
+
+def render_histogram(timeline, width=900, height=420):
+    """PNG-гистограмма событий по времени (подписи - время сервера)"""
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    first, bucket, bars = bucket_timeline(timeline)
+    # Короткий ряд дополняем пустыми минутами, чтобы столбцы не растягивались на всю ширину
+    if len(bars) < HISTOGRAM_MIN_BARS:
+        bars = np.pad(bars, (0, HISTOGRAM_MIN_BARS - len(bars)))
+
+    margin_left, margin_right, margin_top, margin_bottom = 50, 20, 20, 40
+    plot_width = width - margin_left - margin_right
+    plot_height = height - margin_top - margin_bottom
+
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+
+    peak = int(bars.max())
+    bar_width = plot_width / len(bars)
+    heights = bars * plot_height / max(peak, 1)
+
+    for index, bar_height in enumerate(heights):
+        if bar_height <= 0:
+            continue
+        x0 = margin_left + index * bar_width
+        draw.rectangle([x0 + 1, margin_top + plot_height - bar_height,
+                        x0 + max(bar_width - 1, 1), margin_top + plot_height],
+                       fill=(52, 120, 198))
+
+    # Оси и подписи: максимум слева, время под осью
+    draw.line([margin_left, margin_top, margin_left, margin_top + plot_height], fill='black')
+    draw.line([margin_left, margin_top + plot_height, width - margin_right, margin_top + plot_height], fill='black')
+    draw.text((5, margin_top), str(peak), fill='black')
+    draw.text((5, margin_top + plot_height - 10), '0', fill='black')
+
+    label_step = max(1, len(bars) // 8)
+    for index in range(0, len(bars), label_step):
+        label = time.strftime('%H:%M', time.localtime((first + index * bucket) * 60))
+        draw.text((margin_left + index * bar_width, margin_top + plot_height + 8), label, fill='black')
+
+    output = BytesIO()
+    image.save(output, format='PNG')
+    output.seek(0)
+    return output, bucket, peak
+
+
+# ========== СОСТОЯНИЯ ДИАЛОГОВ ==========
+# Пошаговые диалоги (регистрация, создание мероприятия и т.д.) хранят текущий шаг
+# и собранные данные в хранилище состояний: переживают перезапуск и забываются по STATE_TTL.
+# Обработчики шагов регистрируются первыми, поэтому ожидаемый ответ не перехватят кнопки и команды.
+state_store = create_state_store()
+
+# Какие сообщения может ждать шаг диалога
+USER_STEP_CONTENT_TYPES = ['text']
+ADMIN_STEP_CONTENT_TYPES = ['text', 'photo']
+
+
+def state_key(bot_name, chat_id):
+    """Ключ состояния: бот и чат"""
+    return f"{bot_name}:{chat_id}"
+
+
+def set_step(bot_name, chat_id, step, data=None):
+    """Ждет следующего сообщения чата на шаге step"""
+    state_store.set(state_key(bot_name, chat_id), step, data)
+
+
+def has_step(bot_name, chat_id):
+    """Ждет ли чат ответа на шаг диалога"""
+    return state_store.get(state_key(bot_name, chat_id)) is not None
+
+
+def run_step(bot_name, message, steps):
+    """Забирает состояние чата и выполняет его шаг. Шаг сам ставит следующий, если диалог продолжается"""
+    state = state_store.pop(state_key(bot_name, message.chat.id))
+    if not state:
+        return
+
+    step = steps.get(state['step'])
+    if step:
+        step(message, state['data'])
+    else:
+        print(f"⚠️ Неизвестный шаг диалога '{state['step']}' ({bot_name}:{message.chat.id})")
+
+
+@user_bot.message_handler(func=lambda message: has_step('user', message.chat.id),
+                          content_types=USER_STEP_CONTENT_TYPES)
+def user_step_handler(message):
+    """Ответ на шаг диалога в пользовательском боте"""
+    run_step('user', message, USER_STEPS)
+
+
+@admin_bot.message_handler(func=lambda message: message.text != "❌ Отмена операции"
+                           and has_step('admin', message.chat.id),
+                           content_types=ADMIN_STEP_CONTENT_TYPES)
+def admin_step_handler(message):
+    """Ответ на шаг диалога в админ-боте ('Отмена операции' обрабатывается отдельно)"""
+    run_step('admin', message, ADMIN_STEPS)
+
+
+# ========== ЗАЩИТА ОТ ПОВТОРНЫХ НАЖАТИЙ И ФЛУДА ==========
+# Повторные нажатия на кнопку, пока первый ответ еще обрабатывается, отбрасываются
+RSVP_GUARD_TTL = float(os.getenv('RSVP_GUARD_TTL', '30'))
+# Обновлений от одного пользователя: в среднем в секунду и подряд без ожидания
+USER_RATE_LIMIT = float(os.getenv('USER_RATE_LIMIT', '1'))
+USER_RATE_BURST = int(os.getenv('USER_RATE_BURST', '5'))
+
+# (user_id, event_id) -> время, после которого ответ считается завершенным
+rsvp_in_flight = {}
+rsvp_in_flight_lock = threading.Lock()
+
+# user_id -> (токены, время последнего пополнения)
+user_buckets = {}
+user_buckets_lock = threading.Lock()
+
+
+def claim_rsvp(user_id, event_id):
+    """Занимает обработку ответа. False - такой же ответ уже обрабатывается"""
+    now = time.monotonic()
+    key = (user_id, event_id)
+
+    with rsvp_in_flight_lock:
+        if len(rsvp_in_flight) > 1000:
+            for stale_key in [k for k, expires in rsvp_in_flight.items() if expires <= now]:
+                del rsvp_in_flight[stale_key]
+
+        expires = rsvp_in_flight.get(key)
+        if expires and expires > now:
+            return False
+
+        rsvp_in_flight[key] = now + RSVP_GUARD_TTL
+        return True
+
+
+def release_rsvp(user_id, event_id):
+    """Освобождает обработку ответа"""
+    with rsvp_in_flight_lock:
+        rsvp_in_flight.pop((user_id, event_id), None)
+
+
+def allow_user_update(user_id):
+    """Token bucket: False, если пользователь присылает обновления слишком часто"""
+    now = time.monotonic()
+
+    with user_buckets_lock:
+        if len(user_buckets) > 10000:
+            # Полные корзины не отличаются от отсутствующих
+            refill_time = USER_RATE_BURST / USER_RATE_LIMIT
+            for stale_id in [uid for uid, (_, last) in user_buckets.items() if now - last > refill_time]:
+                del user_buckets[stale_id]
+
+        tokens, last = user_buckets.get(user_id, (USER_RATE_BURST, now))
+        tokens = min(USER_RATE_BURST, tokens + (now - last) * USER_RATE_LIMIT)
+
+        if tokens < 1:
+            user_buckets[user_id] = (tokens, now)
+            return False
+
+        user_buckets[user_id] = (tokens - 1, now)
+        return True
+
+
+class UserFloodMiddleware(BaseMiddleware):
+    """Отбрасывает сообщения и нажатия пользователя сверх лимита до запуска обработчиков"""
+
+    def __init__(self):
+        super().__init__()
+        self.update_types = ['message', 'callback_query']
+
+    def pre_process(self, update, data):
+        if allow_user_update(update.from_user.id):
+            return None
+
+        if isinstance(update, types.CallbackQuery):
+            try:
+                user_bot.answer_callback_query(update.id, "⏳ Слишком часто, подождите немного")
+            except Exception:
+                pass
+
+        return CancelUpdate()
+
+    def post_process(self, update, data, exception):
+        pass
+
+
+user_bot.setup_middleware(UserFloodMiddleware())
 
 
+# ========== ПОЛЬЗОВАТЕЛЬСКИЙ БОТ ==========
 def is_command(text):
     """Проверяет, является ли текст командой (начинается с /)"""
     return text and text.startswith('/')
@@ -914,8 +2165,6 @@ def send_welcome(message):
                               reply_markup=user_keyboard)
         return
 
-    user_data[user_id] = {'step': 'name'}
-
     welcome_text = (
         "👋 *Приветствую!*\n\n"
         "Этот бот служит для приглашения учеников на мероприятия.\n\n"
@@ -923,12 +2172,12 @@ def send_welcome(message):
         "Введите ваше имя:"
     )
 
-    msg = user_bot.send_message(message.chat.id, welcome_text,
-                                parse_mode='Markdown')
-    user_bot.register_next_step_handler(msg, get_name)
+    user_bot.send_message(message.chat.id, welcome_text,
+                          parse_mode='Markdown')
+    set_step('user', message.chat.id, 'name')
 
 
-def get_name(message):
+def get_name(message, data):
     user_id = message.from_user.id
 
     if is_user_registered(user_id):
@@ -936,8 +2185,6 @@ def get_name(message):
                               "❌ Вы уже зарегистрированы!\n\n"
                               "Используйте другие команды из меню.",
                               reply_markup=user_keyboard)
-        if user_id in user_data:
-            del user_data[user_id]
         return
 
     if is_invalid_name(message.text):
@@ -950,20 +2197,17 @@ def get_name(message):
                               "• Не содержать спецсимволы\n\n"
                               "Введите ваше имя еще раз:",
                               parse_mode='Markdown')
-        msg = user_bot.send_message(user_id, 'Введите ваше имя:')
-        user_bot.register_next_step_handler(msg, get_name)
+        user_bot.send_message(user_id, 'Введите ваше имя:')
+        set_step('user', message.chat.id, 'name')
         return
 
-    user_data[user_id]['name'] = message.text.strip()
-    user_data[user_id]['step'] = 'surname'
-
     user_bot.send_message(user_id,
                           f"✅ Имя принято: {message.text.strip()}\n\n"
                           "Теперь введите вашу фамилию:")
-    user_bot.register_next_step_handler(message, get_surname)
+    set_step('user', message.chat.id, 'surname', {'name': message.text.strip()})
 
 
-def get_surname(message):
+def get_surname(message, data):
     user_id = message.from_user.id
 
     if is_user_registered(user_id):
@@ -971,8 +2215,6 @@ def get_surname(message):
                               "❌ Вы уже зарегистрированы!\n\n"
                               "Используйте другие команды из меню.",
                               reply_markup=user_keyboard)
-        if user_id in user_data:
-            del user_data[user_id]
         return
 
     if is_invalid_name(message.text):
@@ -986,16 +2228,16 @@ def get_surname(message):
                               "Введите вашу фамилию еще раз:",
                               parse_mode='Markdown')
         user_bot.send_message(user_id, "Введите вашу фамилию:")
-        user_bot.register_next_step_handler(message, get_surname)
+        set_step('user', message.chat.id, 'surname', data)
         return
 
-    if user_id not in user_data or 'name' not in user_data[user_id]:
+    if 'name' not in data:
         user_bot.send_message(user_id,
                               "❌ Что-то пошло не так. Начните сначала: /start",
                               reply_markup=user_keyboard)
         return
 
-    name = user_data[user_id]['name']
+    name = data['name']
     surname = message.text.strip()
 
     try:
@@ -1026,8 +2268,140 @@ def get_surname(message):
                               f"❌ Ошибка сохранения: {str(e)[:100]}\n\nПопробуйте снова: /start",
                               reply_markup=user_keyboard)
 
-    if user_id in user_data:
-        del user_data[user_id]
+
+# Шаги регистрации
+USER_STEPS = {
+    'name': get_name,
+    'surname': get_surname,
+}
+
+
+# Ответ на нажатие кнопки отправляется сразу после сохранения,
+# а QR-код и сообщения пользователю уходят из фонового пула task_pools['replies']
+# 1 - QR-код и пояснение одним сообщением (фото с подписью), 0 - отдельными сообщениями
+RSVP_COMPACT_REPLY = os.getenv('RSVP_COMPACT_REPLY', '1') == '1'
+# 0 - не редактировать приглашение после ответа (на один запрос к Telegram меньше)
+RSVP_EDIT_INVITATION = os.getenv('RSVP_EDIT_INVITATION', '1') == '1'
+
+
+def format_invitation_status(name, surname, event_id, event_name, invitation_text, status_text):
+    """Текст приглашения с ответом пользователя"""
+    return (
+        f"🎫 *Приглашение на мероприятие*\n\n"
+        f"Здравствуйте, *{name} {surname}*!\n\n"
+        f"Вы приглашены на мероприятие:\n"
+        f"*{event_name}* (№{event_id})\n\n"
+        f"📝 *Описание:*\n"
+        f"{invitation_text}\n\n"
+        f"{status_text}"
+    )
+
+
+def callback_message_unavailable(call):
+    """Сообщение с кнопкой недоступно: нажатие из инлайн-режима (call.message нет)
+    или по сообщению старше 48 часов/удаленному (InaccessibleMessage без содержимого)"""
+    return call.message is None or isinstance(call.message, types.InaccessibleMessage)
+
+
+def edit_invitation(user_id, message_id, is_photo, text):
+    """Обновляет приглашение: подпись к фото или текст сообщения"""
+    try:
+        if is_photo:
+            user_bot.edit_message_caption(
+                chat_id=user_id,
+                message_id=message_id,
+                caption=text,
+                parse_mode='Markdown'
+            )
+        else:
+            user_bot.edit_message_text(
+                chat_id=user_id,
+                message_id=message_id,
+                text=text,
+                parse_mode='Markdown'
+            )
+    except Exception as e:
+        print(f"❌ Ошибка редактирования сообщения: {e}")
+        user_bot.send_message(user_id, text, parse_mode='Markdown')
+
+
+def send_rsvp_yes(user_id, event_id, name, surname, event_name, invitation_text, message_id, is_photo):
+    """Отправляет QR-код после ответа 'Да' (выполняется в фоне)"""
+    try:
+        qr_image, qr_data = load_qr_utils().create_qr_code(event_id, user_id)
+
+        if RSVP_EDIT_INVITATION:
+            edit_invitation(user_id, message_id, is_photo, format_invitation_status(
+                name, surname, event_id, event_name, invitation_text,
+                "✅ *Вы ответили:* Да, буду участвовать\n\n"
+                "_Статус: ✅ QR-код отправлен_"
+            ))
+
+        qr_message = (
+            f"🎉 *Отлично! Вы подтвердили участие!*\n\n"
+            f"Мероприятие: *{event_name}*\n\n"
+            f"📱 *Это ваш пригласительный QR-код:*\n"
+            f"Покажите его на мероприятии и вас пропустят.\n\n"
+            f"💡 *Совет:* Сохраните этот QR-код в галерее телефона."
+        )
+
+        qr_image.seek(0)
+        if RSVP_COMPACT_REPLY:
+            user_bot.send_photo(user_id, qr_image,
+                                caption=f"{qr_message}\n\nКод: `{qr_data}`",
+                                parse_mode='Markdown')
+        else:
+            user_bot.send_message(user_id, qr_message, parse_mode='Markdown')
+            user_bot.send_photo(user_id, qr_image,
+                                caption=f"QR-код для мероприятия: {event_name}\nКод: {qr_data}")
+
+        mark_qr_sent(user_id, event_id)
+
+        try:
+            attendance_cursor.execute(
+                'INSERT OR IGNORE INTO attendance (user_id, event_name, attendance_status) VALUES (?, ?, ?)',
+                (user_id, event_name, 0)
+            )
+            attendance_conn.commit()
+        except Exception as attendance_error:
+            print(f"❌ Ошибка создания записи о посещаемости: {attendance_error}")
+
+        event_day_add_attendee(event_id, user_id, name, surname)
+
+        print(f"✅ Принял приглашение: {name} {surname} на {event_name}")
+
+    except Exception as e:
+        print(f"❌ Ошибка создания QR для {name} {surname}: {e}")
+        user_bot.send_message(user_id,
+                              "❌ Ошибка при создании QR-кода. Попробуйте позже.",
+                              reply_markup=user_keyboard)
+
+
+def send_rsvp_no(user_id, event_id, name, surname, event_name, invitation_text, message_id, is_photo):
+    """Обновляет приглашение после отказа (выполняется в фоне)"""
+    try:
+        if RSVP_EDIT_INVITATION:
+            edit_invitation(user_id, message_id, is_photo, format_invitation_status(
+                name, surname, event_id, event_name, invitation_text,
+                "❌ *Вы ответили:* Нет, не смогу\n\n"
+                "_Спасибо за ваш ответ!_"
+            ))
+
+        decline_message = (
+            f"📭 *Ваш ответ сохранен*\n\n"
+            f"Вы отказались от участия в мероприятии:\n"
+            f"*{event_name}*\n\n"
+            f"Спасибо за ваш ответ!"
+        )
+
+        user_bot.send_message(user_id, decline_message,
+                              parse_mode='Markdown',
+                              reply_markup=user_keyboard)
+
+        print(f"❌ Отказался: {name} {surname} от {event_name}")
+
+    except Exception as e:
+        print(f"❌ Ошибка отправки ответа для {name} {surname}: {e}")
 
 
 @user_bot.callback_query_handler(func=lambda call: call.data.startswith('response_'))
@@ -1044,195 +2418,82 @@ def handle_inline_response(call):
     response_type = parts[1]
     event_id = int(parts[3])
 
+    # Нажатие из инлайн-режима или по недоступному сообщению: ни типа, ни подписи у него нет
+    if callback_message_unavailable(call):
+        user_bot.answer_callback_query(call.id, "❌ Сообщение с приглашением недоступно")
+        return
+
+    # Повторное нажатие, пока первое еще обрабатывается, только снимает "часики" - до любых запросов к базе
+    if not claim_rsvp(user_id, event_id):
+        user_bot.answer_callback_query(call.id, "⏳ Ваш ответ уже обрабатывается")
+        return
+
     users_cursor.execute('SELECT name, surname FROM users WHERE telegram_id = ?', (user_id,))
     user_info = users_cursor.fetchone()
 
     if not user_info:
+        release_rsvp(user_id, event_id)
         user_bot.answer_callback_query(call.id, "❌ Сначала зарегистрируйтесь через /start")
         user_bot.send_message(user_id, "❌ Сначала зарегистрируйтесь: /start", reply_markup=user_keyboard)
         return
 
     name, surname = user_info
 
-    events_cursor.execute('SELECT event_name, invitation_text, event_photo_id FROM events WHERE event_id = ?',
+    events_cursor.execute('SELECT event_name, invitation_text FROM events WHERE event_id = ?',
                           (event_id,))
     event_info = events_cursor.fetchone()
 
     if not event_info:
+        release_rsvp(user_id, event_id)
         user_bot.answer_callback_query(call.id, "❌ Мероприятие не найдено")
         return
 
-    event_name, invitation_text, event_photo_id = event_info
+    event_name, invitation_text = event_info
 
-    message_id = get_invitation_message_id(user_id, event_id)
-    if not message_id:
-        user_bot.answer_callback_query(call.id, "❌ Сообщение с приглашением не найдено")
-        return
-
-    existing_response = check_user_response(user_id, event_id)
-
-    if existing_response:
-        response_text = "✅ Да" if existing_response[0] == 'yes' else "❌ Нет"
-        updated_text = (
-            f"🎫 *Приглашение на мероприятие*\n\n"
-            f"Здравствуйте, *{name} {surname}*!\n\n"
-            f"Вы приглашены на мероприятие:\n"
-            f"*{event_name}* (№{event_id})\n\n"
-            f"📝 *Описание:*\n"
-            f"{invitation_text}\n\n"
-            f"✅ *Вы уже ответили:* {response_text}\n\n"
-            f"_Статус: {'✅ QR-код отправлен' if existing_response[1] else '⏳ Ожидание QR-кода'}_"
-        )
-
-        try:
-            if event_photo_id:
-                user_bot.edit_message_caption(
-                    chat_id=user_id,
-                    message_id=message_id,
-                    caption=updated_text,
-                    parse_mode='Markdown'
-                )
-            else:
-                user_bot.edit_message_text(
-                    chat_id=user_id,
-                    message_id=message_id,
-                    text=updated_text,
-                    parse_mode='Markdown'
-                )
-        except Exception as e:
-            print(f"❌ Ошибка редактирования сообщения: {e}")
-            user_bot.send_message(user_id, updated_text, parse_mode='Markdown')
-
-        user_bot.answer_callback_query(call.id, f"Вы уже ответили: {response_text}")
-        return
-
-    try:
-        responses_cursor.execute(
-            'INSERT OR REPLACE INTO user_responses (user_id, event_id, response, qr_sent) VALUES (?, ?, ?, 0)',
-            (user_id, event_id, response_type)
-        )
-        responses_conn.commit()
-
-    except Exception as e:
-        print(f"❌ Ошибка сохранения ответа: {e}")
-        user_bot.answer_callback_query(call.id, "❌ Ошибка сохранения ответа")
-        return
-
-    if response_type == 'yes':
-        try:
-            qr_image, qr_data = create_qr_code(event_id, user_id)
-
-            updated_text = (
-                f"🎫 *Приглашение на мероприятие*\n\n"
-                f"Здравствуйте, *{name} {surname}*!\n\n"
-                f"Вы приглашены на мероприятие:\n"
-                f"*{event_name}* (№{event_id})\n\n"
-                f"📝 *Описание:*\n"
-                f"{invitation_text}\n\n"
-                f"✅ *Вы ответили:* Да, буду участвовать\n\n"
-                f"_Статус: ✅ QR-код отправлен_"
-            )
-
-            try:
-                if event_photo_id:
-                    user_bot.edit_message_caption(
-                        chat_id=user_id,
-                        message_id=message_id,
-                        caption=updated_text,
-                        parse_mode='Markdown'
-                    )
-                else:
-                    user_bot.edit_message_text(
-                        chat_id=user_id,
-                        message_id=message_id,
-                        text=updated_text,
-                        parse_mode='Markdown'
-                    )
-            except Exception as edit_error:
-                print(f"❌ Ошибка редактирования сообщения: {edit_error}")
-                user_bot.send_message(user_id, updated_text, parse_mode='Markdown')
-
-            qr_message = (
-                f"🎉 *Отлично! Вы подтвердили участие!*\n\n"
-                f"Мероприятие: *{event_name}*\n\n"
-                f"📱 *Это ваш пригласительный QR-код:*\n"
-                f"Покажите его на мероприятии и вас пропустят.\n\n"
-                f"💡 *Совет:* Сохраните этот QR-код в галерее телефона."
-            )
-
-            user_bot.send_message(user_id, qr_message, parse_mode='Markdown')
-
-            qr_image.seek(0)
-            user_bot.send_photo(user_id, qr_image,
-                                caption=f"QR-код для мероприятия: {event_name}\nКод: {qr_data}")
-
-            mark_qr_sent(user_id, event_id)
-
-            try:
-                attendance_cursor.execute(
-                    'INSERT OR IGNORE INTO attendance (user_id, event_name, attendance_status) VALUES (?, ?, ?)',
-                    (user_id, event_name, 0)
-                )
-                attendance_conn.commit()
-            except Exception as attendance_error:
-                print(f"❌ Ошибка создания записи о посещаемости: {attendance_error}")
-
-            print(f"✅ Принял приглашение: {name} {surname} на {event_name}")
-
-            user_bot.answer_callback_query(call.id, "✅ Спасибо за ответ! QR-код отправлен")
-
-        except Exception as e:
-            print(f"❌ Ошибка создания QR для {name} {surname}: {e}")
-            user_bot.answer_callback_query(call.id, "❌ Ошибка при создании QR-кода")
-            user_bot.send_message(user_id,
-                                  "❌ Ошибка при создании QR-кода. Попробуйте позже.",
-                                  reply_markup=user_keyboard)
-
-    else:
-        updated_text = (
-            f"🎫 *Приглашение на мероприятие*\n\n"
-            f"Здравствуйте, *{name} {surname}*!\n\n"
-            f"Вы приглашены на мероприятие:\n"
-            f"*{event_name}* (№{event_id})\n\n"
-            f"📝 *Описание:*\n"
-            f"{invitation_text}\n\n"
-            f"❌ *Вы ответили:* Нет, не смогу\n\n"
-            f"_Спасибо за ваш ответ!_"
-        )
+    # Сообщение с приглашением приходит вместе с нажатием: его ID и тип (фото или текст)
+    message_id = call.message.message_id
+    is_photo = call.message.content_type == 'photo'
 
-        try:
-            if event_photo_id:
-                user_bot.edit_message_caption(
-                    chat_id=user_id,
-                    message_id=message_id,
-                    caption=updated_text,
-                    parse_mode='Markdown'
-                )
-            else:
-                user_bot.edit_message_text(
-                    chat_id=user_id,
-                    message_id=message_id,
-                    text=updated_text,
-                    parse_mode='Markdown'
-                )
-        except Exception as e:
-            print(f"❌ Ошибка редактирования сообщения: {e}")
-            user_bot.send_message(user_id, updated_text, parse_mode='Markdown')
+    existing_response = check_user_response(user_id, event_id)
 
-        decline_message = (
-            f"📭 *Ваш ответ сохранен*\n\n"
-            f"Вы отказались от участия в мероприятии:\n"
-            f"*{event_name}*\n\n"
-            f"Спасибо за ваш ответ!"
+    if existing_response:
+        response_text = "✅ Да" if existing_response[0] == 'yes' else "❌ Нет"
+        updated_text = format_invitation_status(
+            name, surname, event_id, event_name, invitation_text,
+            f"✅ *Вы уже ответили:* {response_text}\n\n"
+            f"_Статус: {'✅ QR-код отправлен' if existing_response[1] else '⏳ Ожидание QR-кода'}_"
         )
 
-        user_bot.send_message(user_id, decline_message,
-                              parse_mode='Markdown',
-                              reply_markup=user_keyboard)
+        user_bot.answer_callback_query(call.id, f"Вы уже ответили: {response_text}")
+        future = task_pools['replies'].submit(edit_invitation, user_id, message_id, is_photo, updated_text)
+        future.add_done_callback(lambda _: release_rsvp(user_id, event_id))
+        return
 
-        print(f"❌ Отказался: {name} {surname} от {event_name}")
+    try:
+        responses_cursor.execute(
+            'INSERT OR REPLACE INTO user_responses (user_id, event_id, response, qr_sent, responded_at) '
+            'VALUES (?, ?, ?, 0, ?)',
+            (user_id, event_id, response_type, int(time.time()))
+        )
+        responses_conn.commit()
 
+    except Exception as e:
+        print(f"❌ Ошибка сохранения ответа: {e}")
+        release_rsvp(user_id, event_id)
+        user_bot.answer_callback_query(call.id, "❌ Ошибка сохранения ответа")
+        return
+
+    # Ответ сохранен - снимаем "часики" с кнопки, остальное доделает фоновый пул
+    if response_type == 'yes':
+        user_bot.answer_callback_query(call.id, "✅ Спасибо за ответ! Отправляю QR-код")
+        rsvp_task = send_rsvp_yes
+    else:
         user_bot.answer_callback_query(call.id, "❌ Ваш отказ сохранен")
+        rsvp_task = send_rsvp_no
+
+    future = task_pools['replies'].submit(rsvp_task, user_id, event_id, name, surname,
+                                          event_name, invitation_text, message_id, is_photo)
+    future.add_done_callback(lambda _: release_rsvp(user_id, event_id))
 
 
 @user_bot.message_handler(commands=['id'])
@@ -1252,15 +2513,6 @@ def send_user_id(message):
 @user_bot.message_handler(func=lambda message: True)
 def handle_all_messages(message):
     text = message.text
-    user_id = message.from_user.id
-
-    if user_id in user_data:
-        step = user_data[user_id].get('step')
-        if step == 'name':
-            get_name(message)
-        elif step == 'surname':
-            get_surname(message)
-        return
 
     if text == "/start" or text == "📝 Регистрация (/start)":
         send_welcome(message)
@@ -1296,54 +2548,24 @@ def visited_stats_button(message):
                                reply_markup=admin_keyboard)
         return
 
-    events_cursor.execute('SELECT event_name FROM events ORDER BY event_id')
-    events = events_cursor.fetchall()
-
-    if not events:
-        admin_bot.send_message(message.chat.id,
-                               "❌ Нет созданных мероприятий.\n"
-                               "Сначала создайте мероприятие через '📨 Рассылка приглашений'",
-                               reply_markup=admin_keyboard)
-        return
-
-    events_list = "\n".join([f"• {event[0]}" for event in events])
-
-    admin_bot.send_message(message.chat.id,
-                           f"👥 *Статистика посетивших*\n\n"
-                           f"📋 *Доступные мероприятия:*\n"
-                           f"{events_list}\n\n"
-                           f"✍️ *Введите точное название мероприятия:*\n\n"
-                           f"Или нажмите ❌ Отмена для отмены",
-                           parse_mode='Markdown',
-                           reply_markup=cancel_keyboard)
-
-    admin_bot.register_next_step_handler(message, process_visited_stats_request)
+    send_event_picker(message.chat.id, 'visited', "👥 *Статистика посетивших*")
 
 
-def process_visited_stats_request(message):
-    """Обрабатывает запрос статистики посетивших"""
-    if message.text == "❌ Отмена":
-        admin_bot.send_message(message.chat.id,
-                               "❌ Получение статистики отменено",
-                               reply_markup=admin_keyboard)
-        return
-
-    event_name = message.text.strip()
-    event = get_event_by_name(event_name)
+def send_visited_stats(chat_id, event_id):
+    """Отправляет статистику посетивших выбранное мероприятие"""
+    event_info = get_event_info(event_id)
 
-    if not event:
-        admin_bot.send_message(message.chat.id,
-                               f"❌ Мероприятие '{event_name}' не найдено!\n\n"
-                               f"Убедитесь, что вводите точное название мероприятия.\n"
-                               f"Попробуйте снова через меню.",
+    if not event_info:
+        admin_bot.send_message(chat_id,
+                               f"❌ Мероприятие №{event_id} не найдено!",
                                reply_markup=admin_keyboard)
         return
 
-    event_id, event_name = event
+    event_name = event_info[0]
     stats = get_attendance_stats(event_id, event_name)
 
     if not stats:
-        admin_bot.send_message(message.chat.id,
+        admin_bot.send_message(chat_id,
                                f"❌ Ошибка получения статистики для мероприятия: {event_name}",
                                reply_markup=admin_keyboard)
         return
@@ -1357,7 +2579,7 @@ def process_visited_stats_request(message):
         f"📊 *Статистика основана на отсканированных QR-кодах*"
     )
 
-    admin_bot.send_message(message.chat.id,
+    admin_bot.send_message(chat_id,
                            stats_message,
                            parse_mode='Markdown',
                            reply_markup=admin_keyboard)
@@ -1376,20 +2598,12 @@ def admin_sending_button(message):
 
     event_num = get_next_event_number()
 
-    if not hasattr(admin_bot, 'user_data'):
-        admin_bot.user_data = {}
-
-    admin_bot.user_data[message.chat.id] = {
-        'next_event_num': event_num,
-        'step': 'waiting_for_name'
-    }
-
     admin_bot.send_message(message.chat.id,
                            f"🎬 Создание мероприятия №{event_num}\n\n"
                            f"Введите название мероприятия:\n\n"
                            f"Или нажмите ❌ Отмена для отмены",
                            reply_markup=cancel_keyboard)
-    admin_bot.register_next_step_handler(message, get_event_name)
+    set_step('admin', message.chat.id, 'event_name', {'event_num': event_num})
 
 
 @admin_bot.message_handler(func=lambda message: message.text == "🔍 Сканировать QR")
@@ -1409,10 +2623,10 @@ def scan_qr_button(message):
                            "Или нажмите ❌ Отмена для отмены",
                            parse_mode='Markdown',
                            reply_markup=cancel_keyboard)
-    admin_bot.register_next_step_handler(message, process_qr_scan_admin)
+    set_step('admin', message.chat.id, 'qr_scan')
 
 
-def process_qr_scan_admin(message):
+def process_qr_scan_admin(message, data=None):
     """Обработка фото с QR-кодом в админ-боте (СОХРАНЕНА)"""
     if message.text == "❌ Отмена":
         admin_bot.send_message(message.chat.id,
@@ -1449,10 +2663,10 @@ def announce_button(message):
                            parse_mode='Markdown',
                            reply_markup=cancel_keyboard)
 
-    admin_bot.register_next_step_handler(message, process_announcement_message)
+    set_step('admin', message.chat.id, 'announcement')
 
 
-def process_announcement_message(message):
+def process_announcement_message(message, data=None):
     """Обрабатывает сообщение для рассылки"""
     if message.text == "❌ Отмена":
         admin_bot.send_message(message.chat.id,
@@ -1473,7 +2687,7 @@ def process_announcement_message(message):
                            f"⏳ Начинаю рассылку...",
                            reply_markup=admin_keyboard)
 
-    broadcast_message_to_all(message.chat.id, message_text)
+    run_bulk(broadcast_message_to_all, message.chat.id, message_text)
 
 
 @admin_bot.message_handler(func=lambda message: message.text == "👤 Редактировать пользователя")
@@ -1497,10 +2711,10 @@ def edit_user_button(message):
                            parse_mode='Markdown',
                            reply_markup=cancel_keyboard)
 
-    admin_bot.register_next_step_handler(message, process_user_edit)
+    set_step('admin', message.chat.id, 'user_edit')
 
 
-def process_user_edit(message):
+def process_user_edit(message, data=None):
     """Обрабатывает редактирование пользователя"""
     if message.text == "❌ Отмена":
         admin_bot.send_message(message.chat.id,
@@ -1570,6 +2784,8 @@ def process_user_edit(message):
                 f"✅ Данные успешно перезаписаны!"
             )
 
+            event_day_update_name(user_id, name, surname)
+
             print(f"✏️ Отредактирован: {old_name} {old_surname} → {name} {surname} (ID: {user_id})")
 
         except Exception as e:
@@ -1606,94 +2822,115 @@ def stats_button(message):
                                reply_markup=admin_keyboard)
         return
 
-    events_cursor.execute('SELECT event_name FROM events ORDER BY event_id')
-    events = events_cursor.fetchall()
+    send_event_picker(message.chat.id, 'stats', "📊 *Статистика приглашений*")
 
-    if not events:
-        admin_bot.send_message(message.chat.id,
-                               "❌ Нет созданных мероприятий.\n"
-                               "Сначала создайте мероприятие через '📨 Рассылка приглашений'",
+
+def send_invitation_stats(chat_id, event_id):
+    """Отправляет статистику приглашений выбранного мероприятия"""
+    event_info = get_event_info(event_id)
+
+    if not event_info:
+        admin_bot.send_message(chat_id,
+                               f"❌ Мероприятие №{event_id} не найдено!",
                                reply_markup=admin_keyboard)
         return
 
-    events_list = "\n".join([f"• {event[0]}" for event in events])
+    stats = get_invitation_stats(event_id)
+    stats_message = format_stats_message(event_info[0], stats)
 
-    admin_bot.send_message(message.chat.id,
-                           f"📊 *Статистика приглашений*\n\n"
-                           f"📋 *Доступные мероприятия:*\n"
-                           f"{events_list}\n\n"
-                           f"✍️ *Введите точное название мероприятия:*\n\n"
-                           f"Или нажмите ❌ Отмена для отмены",
+    admin_bot.send_message(chat_id,
+                           stats_message,
                            parse_mode='Markdown',
-                           reply_markup=cancel_keyboard)
+                           reply_markup=admin_keyboard)
 
-    admin_bot.register_next_step_handler(message, process_stats_request)
 
+def send_event_picker(chat_id, kind, title):
+    """Отправляет список мероприятий кнопками"""
+    keyboard = create_event_picker(kind)
 
-def process_stats_request(message):
-    """Обрабатывает запрос статистики"""
-    if message.text == "❌ Отмена":
-        admin_bot.send_message(message.chat.id,
-                               "❌ Получение статистики отменено",
+    if not keyboard:
+        admin_bot.send_message(chat_id,
+                               "❌ Нет созданных мероприятий.\n"
+                               "Сначала создайте мероприятие через '📨 Рассылка приглашений'",
                                reply_markup=admin_keyboard)
         return
 
-    event_name = message.text.strip()
-    event = get_event_by_name(event_name)
+    admin_bot.send_message(chat_id,
+                           f"{title}\n\n"
+                           f"📋 *Выберите мероприятие:*",
+                           parse_mode='Markdown',
+                           reply_markup=keyboard)
 
-    if not event:
-        admin_bot.send_message(message.chat.id,
-                               f"❌ Мероприятие '{event_name}' не найдено!\n\n"
-                               f"Убедитесь, что вводите точное название мероприятия.\n"
-                               f"Попробуйте снова через меню.",
-                               reply_markup=admin_keyboard)
+
+# Что показать по выбранному мероприятию
+EVENT_PICKER_ACTIONS = {
+    'stats': send_invitation_stats,
+    'visited': send_visited_stats,
+}
+
+
+@admin_bot.callback_query_handler(func=lambda call: call.data.startswith(('pick_', 'pickpage_')))
+def event_picker_callback(call):
+    """Выбор мероприятия и перелистывание списка"""
+    if call.from_user.id not in ADMIN_IDS:
+        admin_bot.answer_callback_query(call.id, "❌ У вас нет прав администратора!")
         return
 
-    event_id, event_name = event
-    stats = get_invitation_stats(event_id)
-    stats_message = format_stats_message(event_name, stats)
+    action, kind, event_id = call.data.split('_')
+    event_id = int(event_id)
 
-    admin_bot.send_message(message.chat.id,
-                           stats_message,
-                           parse_mode='Markdown',
-                           reply_markup=admin_keyboard)
+    if kind not in EVENT_PICKER_ACTIONS:
+        admin_bot.answer_callback_query(call.id, "❌ Ошибка обработки ответа")
+        return
+
+    if callback_message_unavailable(call):
+        admin_bot.answer_callback_query(call.id, "❌ Сообщение недоступно, откройте список заново")
+        return
+
+    if action == 'pickpage':
+        try:
+            admin_bot.edit_message_reply_markup(chat_id=call.message.chat.id,
+                                                message_id=call.message.message_id,
+                                                reply_markup=create_event_picker(kind, event_id))
+        except Exception as e:
+            print(f"❌ Ошибка перелистывания мероприятий: {e}")
+        admin_bot.answer_callback_query(call.id)
+        return
+
+    admin_bot.answer_callback_query(call.id)
+    EVENT_PICKER_ACTIONS[kind](call.message.chat.id, event_id)
 
 
 @admin_bot.message_handler(func=lambda message: message.text == "❌ Отмена операции")
 def cancel_operation_button(message):
     """Обработка кнопки 'Отмена операции'"""
-    if hasattr(admin_bot, 'user_data') and message.chat.id in admin_bot.user_data:
+    if has_step('admin', message.chat.id):
+        state_store.delete(state_key('admin', message.chat.id))
         admin_bot.send_message(message.chat.id,
                                "❌ Текущая операция отменена",
                                reply_markup=admin_keyboard)
-        del admin_bot.user_data[message.chat.id]
     else:
         admin_bot.send_message(message.chat.id,
                                "❌ Нет активной операции для отмена",
                                reply_markup=admin_keyboard)
 
 
-def get_event_name(message):
+def get_event_name(message, data):
     if is_cancel_command(message.text):
         admin_bot.send_message(message.chat.id,
                                "❌ Создание мероприятия отменено",
                                reply_markup=admin_keyboard)
-        if hasattr(admin_bot, 'user_data') and message.chat.id in admin_bot.user_data:
-            del admin_bot.user_data[message.chat.id]
         return
 
-    if not hasattr(admin_bot, 'user_data'):
-        admin_bot.user_data = {}
-
-    if message.chat.id not in admin_bot.user_data:
-        admin_bot.user_data[message.chat.id] = {}
+    if not message.text:
+        admin_bot.send_message(message.chat.id,
+                               "❌ Введите название мероприятия текстом:",
+                               reply_markup=cancel_keyboard)
+        set_step('admin', message.chat.id, 'event_name', data)
+        return
 
     event_name = message.text
-    event_num = admin_bot.user_data[message.chat.id].get('next_event_num', 1)
-
-    admin_bot.user_data[message.chat.id]['event_num'] = event_num
-    admin_bot.user_data[message.chat.id]['event_name'] = event_name
-    admin_bot.user_data[message.chat.id]['step'] = 'waiting_for_photo'
+    event_num = data.get('event_num', 1)
 
     admin_bot.send_message(message.chat.id,
                            f"✅ Название сохранено!\n\n"
@@ -1703,27 +2940,18 @@ def get_event_name(message):
                            f"(или отправьте любое текстовое сообщение, чтобы пропустить):\n\n"
                            f"Или нажмите ❌ Отмена для отмена",
                            reply_markup=cancel_keyboard)
-    admin_bot.register_next_step_handler(message, get_event_photo)
+    set_step('admin', message.chat.id, 'event_photo', {'event_num': event_num, 'event_name': event_name})
 
 
-def get_event_photo(message):
+def get_event_photo(message, data):
     if is_cancel_command(message.text):
         admin_bot.send_message(message.chat.id,
                                "❌ Создание мероприятия отменено",
                                reply_markup=admin_keyboard)
-        if hasattr(admin_bot, 'user_data') and message.chat.id in admin_bot.user_data:
-            del admin_bot.user_data[message.chat.id]
-        return
-
-    if not hasattr(admin_bot, 'user_data') or message.chat.id not in admin_bot.user_data:
-        admin_bot.send_message(message.chat.id,
-                               "❌ Ошибка: данные сессии потеряны.\n\nПопробуйте снова через меню",
-                               reply_markup=admin_keyboard)
         return
 
-    user_data = admin_bot.user_data[message.chat.id]
-    event_num = user_data.get('event_num', 0)
-    event_name = user_data.get('event_name', '')
+    event_num = data.get('event_num', 0)
+    event_name = data.get('event_name', '')
 
     if event_num == 0 or not event_name:
         admin_bot.send_message(message.chat.id,
@@ -1736,7 +2964,7 @@ def get_event_photo(message):
     if message.photo:
         try:
             event_photo_id = message.photo[-1].file_id
-            user_data['event_photo_id'] = event_photo_id
+            data['event_photo_id'] = event_photo_id
             admin_bot.send_message(message.chat.id,
                                    f"✅ Фотография получена!\n\n"
                                    f"Теперь введите текст приглашения:")
@@ -1744,38 +2972,35 @@ def get_event_photo(message):
             print(f"❌ Ошибка получения file_id фото: {e}")
             admin_bot.send_message(message.chat.id,
                                    f"❌ Ошибка при получении фотографии. Попробуйте снова с текстом приглашения:")
-            user_data['event_photo_id'] = None
+            data['event_photo_id'] = None
     else:
         admin_bot.send_message(message.chat.id,
                                f"✅ Пропускаем добавление фотографии.\n\n"
                                f"Теперь введите текст приглашения:")
-        user_data['event_photo_id'] = None
+        data['event_photo_id'] = None
 
-    user_data['step'] = 'waiting_for_invitation_text'
-    admin_bot.register_next_step_handler(message, get_invitation_text)
+    set_step('admin', message.chat.id, 'invitation_text', data)
 
 
-def get_invitation_text(message):
+def get_invitation_text(message, data):
     if is_cancel_command(message.text):
         admin_bot.send_message(message.chat.id,
                                "❌ Создание мероприятия отменено",
                                reply_markup=admin_keyboard)
-        if hasattr(admin_bot, 'user_data') and message.chat.id in admin_bot.user_data:
-            del admin_bot.user_data[message.chat.id]
         return
 
-    if not hasattr(admin_bot, 'user_data') or message.chat.id not in admin_bot.user_data:
+    if not message.text:
         admin_bot.send_message(message.chat.id,
-                               "❌ Ошибка: данные сессии потеряны.\n\nПопробуйте снова через меню",
-                               reply_markup=admin_keyboard)
+                               "❌ Введите текст приглашения текстом:",
+                               reply_markup=cancel_keyboard)
+        set_step('admin', message.chat.id, 'invitation_text', data)
         return
 
     invitation_text = message.text
-    user_data = admin_bot.user_data[message.chat.id]
 
-    event_num = user_data.get('event_num', 0)
-    event_name = user_data.get('event_name', '')
-    event_photo_id = user_data.get('event_photo_id', None)
+    event_num = data.get('event_num', 0)
+    event_name = data.get('event_name', '')
+    event_photo_id = data.get('event_photo_id', None)
 
     if event_num == 0 or not event_name:
         admin_bot.send_message(message.chat.id,
@@ -1802,7 +3027,7 @@ def get_invitation_text(message):
         )
 
         admin_bot.send_message(message.chat.id, preview_message)
-        start_broadcast(message.chat.id, event_num, event_name, invitation_text, event_photo_id)
+        run_bulk(start_broadcast, message.chat.id, event_num, event_name, invitation_text, event_photo_id)
 
     except Exception as e:
         print(f"❌ Ошибка при сохранении мероприятия в базу: {e}")
@@ -1812,6 +3037,265 @@ def get_invitation_text(message):
                                reply_markup=admin_keyboard)
 
 
+# Шаги диалогов админ-бота
+ADMIN_STEPS = {
+    'event_name': get_event_name,
+    'event_photo': get_event_photo,
+    'invitation_text': get_invitation_text,
+    'qr_scan': process_qr_scan_admin,
+    'announcement': process_announcement_message,
+    'user_edit': process_user_edit,
+}
+
+
+@admin_bot.message_handler(commands=['eventday'])
+def event_day_command(message):
+    """Включает/выключает режим дня мероприятия: /eventday <номер> [off]"""
+    if message.from_user.id not in ADMIN_IDS:
+        admin_bot.send_message(message.chat.id,
+                               "❌ У вас нет прав администратора!",
+                               reply_markup=admin_keyboard)
+        return
+
+    if not EVENT_DAY_INDEX:
+        admin_bot.send_message(message.chat.id,
+                               "❌ Режим дня мероприятия выключен (EVENT_DAY_INDEX=0).",
+                               reply_markup=admin_keyboard)
+        return
+
+    parts = message.text.split()[1:]
+
+    # Загрузка гостей и дозапись отметок идут в фоновом пуле, не занимая обработчик админ-бота
+    if not parts:
+        run_bulk(send_event_day_status, message.chat.id)
+        return
+
+    if not parts[0].isdigit():
+        admin_bot.send_message(message.chat.id,
+                               "❌ Укажите номер мероприятия: `/eventday 3`",
+                               parse_mode='Markdown',
+                               reply_markup=admin_keyboard)
+        return
+
+    event_id = int(parts[0])
+
+    if len(parts) > 1 and parts[1].lower() == 'off':
+        run_bulk(switch_off_event_day, message.chat.id, event_id)
+    else:
+        run_bulk(switch_on_event_day, message.chat.id, event_id)
+
+
+def send_event_day_status(chat_id):
+    """Список активных мероприятий с числом отмеченных гостей"""
+    with event_day_lock:
+        events = [(event_id, event['event_name'], len(event['attendees']))
+                  for event_id, event in event_day_index.items()]
+    # Отметки других процессов видны только в базе
+    flush_attendance_writes()
+    active = []
+    for event_id, event_name, guests in events:
+        stats = get_attendance_stats(event_id, event_name)
+        scanned = stats['visited_count'] if stats else '?'
+        active.append(f"• {event_name} (№{event_id}): {scanned}/{guests} отмечено")
+    lines = active or ["Нет активных мероприятий"]
+    # Файл общий для процессов: отложенные отметки видны и из админ-бота
+    parked = len(load_parked_attendance_writes())
+    if parked:
+        lines.append(f"\n⚠️ Не записано в базу: {parked} отм., повтор каждые "
+                     f"{ATTENDANCE_RETRY_INTERVAL:g} с")
+    admin_bot.send_message(chat_id,
+                           "📋 *Режим дня мероприятия*\n\n"
+                           + "\n".join(lines) +
+                           "\n\n`/eventday <номер>` - включить\n"
+                           "`/eventday <номер> off` - выключить",
+                           parse_mode='Markdown',
+                           reply_markup=admin_keyboard)
+
+
+def switch_off_event_day(chat_id, event_id):
+    """Выключает режим дня мероприятия и сообщает администратору"""
+    event = deactivate_event_day(event_id)
+    text = (f"✅ Режим дня мероприятия выключен: {event['event_name']} (№{event_id})"
+            if event else f"❌ Мероприятие №{event_id} не было активно")
+    admin_bot.send_message(chat_id, text, reply_markup=admin_keyboard)
+
+
+def switch_on_event_day(chat_id, event_id):
+    """Загружает гостей мероприятия и сообщает администратору"""
+    event = activate_event_day(event_id)
+    if not event:
+        admin_bot.send_message(chat_id,
+                               f"❌ Мероприятие №{event_id} не найдено!",
+                               reply_markup=admin_keyboard)
+        return
+
+    scanned = sum(1 for attendee in event['attendees'].values() if attendee['scanned'])
+    admin_bot.send_message(chat_id,
+                           f"✅ *Режим дня мероприятия включен*\n\n"
+                           f"🎫 *Мероприятие:* {event['event_name']} (№{event_id})\n"
+                           f"👥 *Гостей в памяти:* {len(event['attendees'])}\n"
+                           f"🎯 *Уже отмечено:* {scanned}\n\n"
+                           f"Сканирование проверяет гостей по списку в памяти.",
+                           parse_mode='Markdown',
+                           reply_markup=admin_keyboard)
+
+
+@admin_bot.message_handler(commands=['dashboard'])
+@admin_bot.message_handler(func=lambda message: message.text == "📈 Сводка по мероприятиям")
+def dashboard_command(message):
+    """Сводка по всем мероприятиям с перелистыванием"""
+    if message.from_user.id not in ADMIN_IDS:
+        admin_bot.send_message(message.chat.id,
+                               "❌ У вас нет прав администратора!",
+                               reply_markup=admin_keyboard)
+        return
+
+    run_bulk(send_dashboard, message.chat.id)
+
+
+def send_dashboard(chat_id):
+    """Отправляет первую страницу сводки"""
+    text, keyboard = format_dashboard_page(get_dashboard_stats(), 0)
+    admin_bot.send_message(chat_id, text,
+                           parse_mode='Markdown',
+                           reply_markup=keyboard)
+
+
+@admin_bot.callback_query_handler(func=lambda call: call.data.startswith('dashboard_'))
+def dashboard_page(call):
+    """Перелистывание сводки по мероприятиям"""
+    if call.from_user.id not in ADMIN_IDS:
+        admin_bot.answer_callback_query(call.id, "❌ У вас нет прав администратора!")
+        return
+
+    if callback_message_unavailable(call):
+        admin_bot.answer_callback_query(call.id, "❌ Сообщение недоступно, откройте сводку заново")
+        return
+
+    admin_bot.answer_callback_query(call.id)
+    run_bulk(edit_dashboard_page, call.message.chat.id, call.message.message_id,
+             int(call.data.split('_')[1]))
+
+
+def edit_dashboard_page(chat_id, message_id, page):
+    """Показывает другую страницу сводки в том же сообщении"""
+    text, keyboard = format_dashboard_page(get_dashboard_stats(), page)
+
+    try:
+        admin_bot.edit_message_text(text=text,
+                                    chat_id=chat_id,
+                                    message_id=message_id,
+                                    parse_mode='Markdown',
+                                    reply_markup=keyboard)
+    except Exception as e:
+        print(f"❌ Ошибка перелистывания сводки: {e}")
+
+
+@admin_bot.message_handler(commands=['export'])
+def export_command(message):
+    """Выгрузка приглашений, ответов и посещений: /export [номер] [xlsx]"""
+    if message.from_user.id not in ADMIN_IDS:
+        admin_bot.send_message(message.chat.id,
+                               "❌ У вас нет прав администратора!",
+                               reply_markup=admin_keyboard)
+        return
+
+    parts = message.text.split()[1:]
+    file_format = 'xlsx' if 'xlsx' in (part.lower() for part in parts) else 'csv'
+    numbers = [part for part in parts if part.isdigit()]
+    event_id = int(numbers[0]) if numbers else None
+
+    if file_format == 'xlsx' and load_openpyxl() is None:
+        admin_bot.send_message(message.chat.id,
+                               "❌ Для XLSX не установлен пакет openpyxl. Выгружаю в CSV.",
+                               reply_markup=admin_keyboard)
+        file_format = 'csv'
+
+    if event_id is not None and not get_event_info(event_id):
+        admin_bot.send_message(message.chat.id,
+                               f"❌ Мероприятие №{event_id} не найдено!",
+                               reply_markup=admin_keyboard)
+        return
+
+    run_bulk(send_export, message.chat.id, event_id, file_format)
+
+
+def send_export(chat_id, event_id, file_format):
+    """Собирает выгрузку и отправляет файл администратору"""
+    try:
+        output, count = build_export(event_id, file_format)
+    except Exception as e:
+        print(f"❌ Ошибка выгрузки: {e}")
+        admin_bot.send_message(chat_id,
+                               "❌ Ошибка при выгрузке данных",
+                               reply_markup=admin_keyboard)
+        return
+
+    file_name = f"export_{event_id if event_id is not None else 'all'}_{time.strftime('%Y%m%d_%H%M')}.{file_format}"
+
+    with output:
+        admin_bot.send_document(chat_id, output,
+                                visible_file_name=file_name,
+                                caption=f"📤 Выгрузка готова. Строк: {count}",
+                                reply_markup=admin_keyboard)
+
+    print(f"📤 Выгрузка {file_name}, строк: {count}")
+
+
+@admin_bot.message_handler(commands=['arrivals', 'responses'])
+def timeline_command(message):
+    """Гистограмма по времени: /arrivals <номер> - приход гостей, /responses <номер> - ответы"""
+    if message.from_user.id not in ADMIN_IDS:
+        admin_bot.send_message(message.chat.id,
+                               "❌ У вас нет прав администратора!",
+                               reply_markup=admin_keyboard)
+        return
+
+    parts = message.text.split()
+    kind = 'arrivals' if parts[0].lstrip('/').startswith('arrivals') else 'responses'
+
+    if len(parts) < 2 or not parts[1].isdigit():
+        admin_bot.send_message(message.chat.id,
+                               f"❌ Укажите номер мероприятия: `/{kind} 3`",
+                               parse_mode='Markdown',
+                               reply_markup=admin_keyboard)
+        return
+
+    event_id = int(parts[1])
+    event_info = get_event_info(event_id)
+    if not event_info:
+        admin_bot.send_message(message.chat.id,
+                               f"❌ Мероприятие №{event_id} не найдено!",
+                               reply_markup=admin_keyboard)
+        return
+
+    run_bulk(send_timeline, message.chat.id, kind, event_id, event_info[0])
+
+
+def send_timeline(chat_id, kind, event_id, event_name):
+    """Строит гистограмму и отправляет ее администратору"""
+    timeline = get_timeline(kind, event_id)
+    title = "Приход гостей" if kind == 'arrivals' else "Ответы на приглашение"
+
+    if not timeline:
+        admin_bot.send_message(chat_id,
+                               f"📭 {title}: для мероприятия {event_name} пока нет данных со временем",
+                               reply_markup=admin_keyboard)
+        return
+
+    histogram, bucket, peak = render_histogram(timeline)
+    total = sum(count for _, count in timeline)
+    start = time.strftime('%d.%m %H:%M', time.localtime(timeline[0][0] * 60))
+    end = time.strftime('%d.%m %H:%M', time.localtime(timeline[-1][0] * 60))
+
+    admin_bot.send_photo(chat_id, histogram,
+                         caption=f"📊 {title}: {event_name} (№{event_id})\n\n"
+                                 f"Всего: {total}\n"
+                                 f"Период: {start} - {end}\n"
+                                 f"Столбец: {bucket} мин., пик: {peak}",
+                         reply_markup=admin_keyboard)
+
+
 @admin_bot.message_handler(commands=['start'])
 def admin_start(message):
     admin_bot.send_message(message.chat.id,
@@ -1823,7 +3307,11 @@ def admin_start(message):
                            "👤 Редактировать пользователя - Изменить данные пользователя\n"
                            "📊 Статистика приглашений - Получить статистику по приглашениям\n"
                            "👥 Статистика посетивших - Узнать сколько человек пришло на мероприятие\n"
-                           "❌ Отмена операции - Отменить текущую операцию\n\n"
+                           "📈 Сводка по мероприятиям - Все мероприятия на одном экране (/dashboard)\n"
+                           "📤 /export [номер] [xlsx] - Выгрузка приглашений и посещений в файл\n"
+                           "⏱ /arrivals <номер>, /responses <номер> - Приход гостей и ответы по минутам\n"
+                           "❌ Отмена операции - Отменить текущую операцию\n"
+                           "📋 /eventday <номер> - Режим дня мероприятия (быстрое сканирование)\n\n"
                            "✅ Используйте кнопки ниже для навигации",
                            parse_mode='Markdown',
                            reply_markup=admin_keyboard)
@@ -1854,6 +3342,10 @@ def scanner_welcome(message):
         "1. Сфотографируйте QR-код участника\n"
         "2. Отправьте фото в этот чат\n"
         "3. Получите результат сканирования\n\n"
+        "🎥 *Очередь целиком:* снимите видео или кружок, медленно проводя камерой "
+        "по QR-кодам - бот отметит всех, кто попал в кадр\n\n"
+        "⌨️ *QR-код не читается:* отправьте код с билета текстом, например `3U123456`. "
+        "Можно несколько кодов в одном сообщении\n\n"
         "✅ *Бот автоматически:*\n"
         "• Проверит QR-код\n"
         "• Найдет пользователя в базе\n"
@@ -1867,7 +3359,24 @@ def scanner_welcome(message):
 @scanner_bot.message_handler(content_types=['photo'])
 def handle_scanner_photo(message):
     """Обработка фото в QR-сканер боте"""
-    process_qr_photo(scanner_bot, message, "QR-SCANNER")
+    if message.media_group_id:
+        collect_album_photo(scanner_bot, message, "QR-SCANNER")
+    else:
+        process_qr_photo(scanner_bot, message, "QR-SCANNER")
+
+
+@scanner_bot.message_handler(content_types=['video', 'video_note'])
+def handle_scanner_video(message):
+    """Обработка видео и видеосообщений в QR-сканер боте"""
+    process_qr_video(scanner_bot, message, "QR-SCANNER")
+
+
+@scanner_bot.message_handler(func=lambda message: bool(extract_qr_codes(message.text)))
+def handle_scanner_text_codes(message):
+    """Коды билетов, набранные текстом, отмечаются без обработки изображений"""
+    codes = extract_qr_codes(message.text)
+    print(f"⌨️ [QR-SCANNER] Кодов в тексте: {len(codes)}")
+    send_check_in_results(scanner_bot, message.chat.id, codes, "QR-SCANNER")
 
 
 @scanner_bot.message_handler(func=lambda message: True)
@@ -1877,19 +3386,136 @@ def handle_scanner_other_messages(message):
         "🤖 *QR-Сканер*\n\n"
         "Этот бот предназначен только для сканирования QR-кодов.\n\n"
         "🚀 *Просто отправьте фото QR-кода!*\n\n"
-        "Бот автоматически проверит QR-код и отметит посещение."
+        "Бот автоматически проверит QR-код и отметит посещение.\n"
+        "Если фото не читается, отправьте код с билета текстом: `3U123456`"
     )
 
     scanner_bot.send_message(message.chat.id, help_text, parse_mode='Markdown')
 
 
 # ========== ЗАПУСК БОТОВ ==========
+# polling - каждый бот сам опрашивает Telegram; webhook - один HTTP-сервер принимает обновления всех ботов
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# Публичный адрес сервера, например https://bot.example.com (пусто - вебхуки не регистрируются, для локальной проверки)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_PORT = int(os.getenv('PORT', '8080'))
+# Адрес для HTTP-сервера: launcher.py ставит 127.0.0.1, наружу порт открывает он сам
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '')
+
+# Роль -> (бот, имя для логов)
+ROLE_BOTS = {
+    'admin': (admin_bot, "ADMIN БОТ"),
+    'user': (user_bot, "USER БОТ"),
+    'scanner': (scanner_bot, "QR-СКАНЕР"),
+}
+
+# Какие боты работают в этом процессе; launcher.py запускает каждую роль отдельными процессами
+BOT_ROLES = [role.strip() for role in os.getenv('BOT_ROLES', 'admin,user,scanner').split(',')
+             if role.strip() in ROLE_BOTS]
+# Номер процесса среди процессов одной роли: вебхук в Telegram регистрирует только первый.
+# launcher.py отдает все обновления одного чата одному и тому же процессу
+BOT_PROCESS_INDEX = int(os.getenv('BOT_PROCESS_INDEX', '0'))
+
+# Путь на сервере -> (бот, имя для логов)
+WEBHOOK_ROUTES = {f'/{role}': ROLE_BOTS[role] for role in BOT_ROLES}
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Принимает обновления Telegram: POST /admin, /user, /scanner; GET /health для проверки"""
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b'ok')
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def do_POST(self):
+        route = WEBHOOK_ROUTES.get(self.path)
+        if not route:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        if WEBHOOK_SECRET and self.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+            self.send_response(403)
+            self.end_headers()
+            return
+
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        try:
+            update = types.Update.de_json(body.decode('utf-8'))
+        except Exception as e:
+            print(f"❌ Некорректное обновление на {self.path}: {e}")
+            self.send_response(400)
+            self.end_headers()
+            return
+
+        # Telegram ждет ответа не дольше нескольких секунд: отвечаем сразу, обрабатываем в пуле.
+        # Если очередь чата переполнена - 503, и Telegram повторит обновление позже
+        bot, bot_name = route
+        self.send_response(200 if dispatch_update(bot, bot_name, update) else 503)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_background_workers():
+    """Потоки пулов и фоновые задачи: запускаются вместе с ботами, импорт main.py их не трогает"""
+    for pool in update_pools.values():
+        pool.start()
+    start_album_dispatcher()
+    start_event_day()
+    start_imaging_preload()
+
+
+def run_webhook():
+    """Запускает ботов из BOT_ROLES через один HTTP-сервер"""
+    print("=" * 50)
+    print("🤖 ЗАПУСК ВСЕХ БОТОВ (WEBHOOK)")
+    print("=" * 50)
+
+    for path, (bot, bot_name) in WEBHOOK_ROUTES.items():
+        if BOT_PROCESS_INDEX > 0:
+            print(f"🔗 {bot_name}: процесс №{BOT_PROCESS_INDEX + 1}, вебхук регистрирует первый процесс")
+        elif WEBHOOK_URL:
+            bot.set_webhook(url=f"{WEBHOOK_URL}{path}", secret_token=WEBHOOK_SECRET or None)
+            print(f"🔗 {bot_name}: {WEBHOOK_URL}{path}")
+        else:
+            print(f"🔗 {bot_name}: http://localhost:{WEBHOOK_PORT}{path} (вебхук в Telegram не зарегистрирован)")
+
+    server = ThreadingHTTPServer((WEBHOOK_HOST, WEBHOOK_PORT), WebhookHandler)
+    print(f"✅ HTTP-сервер слушает порт {WEBHOOK_PORT}")
+    start_background_workers()
+    print("-" * 50)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Остановка всех ботов...")
+    finally:
+        server.server_close()
+
+
 def run_bot(bot, bot_name):
-    """Запускает бота с перезапуском при ошибках"""
+    """Опрашивает Telegram и раздает обновления по пулам, с перезапуском при ошибках"""
+    offset = None
+
     while True:
         try:
             print(f"🚀 Запуск {bot_name}...")
-            bot.polling(none_stop=True, interval=1, timeout=30)
+            # Пока у бота зарегистрирован вебхук, Telegram не отдает обновления через polling
+            bot.remove_webhook()
+
+            while True:
+                for update in bot.get_updates(offset=offset, timeout=30, long_polling_timeout=30):
+                    offset = update.update_id + 1
+                    dispatch_update(bot, bot_name, update)
         except Exception as e:
             print(f"❌ Ошибка в {bot_name}: {e}")
             print(f"🔄 Перезапуск {bot_name} через 5 секунд...")
@@ -1897,37 +3523,42 @@ def run_bot(bot, bot_name):
 
 
 def run_all_bots():
-    """Запускает все три бота в отдельных потоках"""
+    """Запускает ботов из BOT_ROLES в отдельных потоках"""
     print("=" * 50)
     print("🤖 ЗАПУСК ВСЕХ БОТОВ")
     print("=" * 50)
 
-    # Создаем потоки для каждого бота
-    admin_thread = threading.Thread(target=run_bot, args=(admin_bot, "ADMIN БОТ"), daemon=True)
-    user_thread = threading.Thread(target=run_bot, args=(user_bot, "USER БОТ"), daemon=True)
-    scanner_thread = threading.Thread(target=run_bot, args=(scanner_bot, "QR-СКАНЕР"), daemon=True)
+    start_background_workers()
 
-    # Запускаем все потоки
-    admin_thread.start()
-    user_thread.start()
-    scanner_thread.start()
+    # Создаем и запускаем поток для каждого бота
+    threads = []
+    for role in BOT_ROLES:
+        bot, bot_name = ROLE_BOTS[role]
+        thread = threading.Thread(target=run_bot, args=(bot, bot_name), daemon=True)
+        thread.start()
+        threads.append(thread)
 
     print("✅ Все боты запущены в отдельных потоках!")
     print("-" * 50)
-    print("📱 *Админ-бот:* /start - Управление системой")
-    print("🔍 *QR-Сканер:* Просто отправляйте фото QR-кодов")
-    print("👥 *Пользовательский бот:* Работает в фоне")
+    if 'admin' in BOT_ROLES:
+        print("📱 *Админ-бот:* /start - Управление системой")
+    if 'scanner' in BOT_ROLES:
+        print("🔍 *QR-Сканер:* Просто отправляйте фото QR-кодов")
+    if 'user' in BOT_ROLES:
+        print("👥 *Пользовательский бот:* Работает в фоне")
     print("-" * 50)
 
     # Держим главный поток активным
     try:
         # Ждем завершения всех потоков
-        admin_thread.join()
-        user_thread.join()
-        scanner_thread.join()
+        for thread in threads:
+            thread.join()
     except KeyboardInterrupt:
         print("\n🛑 Остановка всех ботов...")
 
 
 if __name__ == '__main__':
-    run_all_bots()
\ No newline at end of file
+    if BOT_MODE == 'webhook':
+        run_webhook()
+    else:
+        run_all_bots()
\ No newline at end of file
@@ -0,0 +1,621 @@
+import os
+import threading
+import time
+from functools import cached_property
+import qrcode
+from io import BytesIO
+import cv2
+import numpy as np
+
+try:
+    from pyzbar import pyzbar
+except Exception:  # нет пакета pyzbar или системной libzbar
+    pyzbar = None
+
+# ========== НАСТРОЙКИ ДЕКОДЕРОВ ==========
+# Порядок движков: первый - основной, остальные - резервные.
+# Например: QR_DECODER_BACKENDS="wechat,opencv,pyzbar"
+QR_DECODER_BACKENDS = os.getenv('QR_DECODER_BACKENDS', 'opencv')
+
+# Запускать ли медленный перебор фильтров, если движки ничего не нашли
+QR_FILTER_FALLBACK = os.getenv('QR_FILTER_FALLBACK', '1') == '1'
+
+# Этапы перебора фильтров по порядку (лишние можно убрать или переставить):
+# variants - 7 фильтров классического детектора, inverted - инверсия цветов,
+# enhanced - контраст/резкость/автоконтраст, combined - итоговый проход 2x
+QR_FILTER_STAGES = os.getenv('QR_FILTER_STAGES', 'variants,inverted,enhanced,combined')
+
+# Бюджет времени на одно сканирование фото, мс (0 - без ограничения).
+# Между этапами декодер проверяет остаток и при нехватке времени
+# возвращает лучший результат на данный момент или "не найдено".
+QR_SCAN_TIME_BUDGET_MS = int(os.getenv('QR_SCAN_TIME_BUDGET_MS', '3000'))
+
+# Папка с моделями WeChat (detect.prototxt, detect.caffemodel, sr.prototxt, sr.caffemodel)
+QR_WECHAT_MODEL_DIR = os.getenv('QR_WECHAT_MODEL_DIR', '')
+
+# Детекторы OpenCV не потокобезопасны - держим по экземпляру на поток
+_detectors = threading.local()
+
+
+# ========== СОЗДАНИЕ QR-КОДОВ ==========
+def create_qr_code(event_number, user_id):
+    """Создает QR-код с данными: номер мероприятия + 'U' + ID пользователя"""
+    qr_data = f"{event_number}U{user_id}"
+
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    bio = BytesIO()
+    img.save(bio, 'PNG')
+    bio.seek(0)
+
+    return bio, qr_data
+
+
+# ========== ДВИЖКИ ДЕКОДИРОВАНИЯ ==========
+def _to_gray(img):
+    """Приводит изображение к одному каналу"""
+    if img.ndim == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return img
+
+
+def _get_detector(name, factory):
+    """Возвращает детектор текущего потока, создавая его при первом обращении"""
+    detector = getattr(_detectors, name, None)
+    if detector is None:
+        detector = factory()
+        setattr(_detectors, name, detector)
+    return detector
+
+
+def _create_wechat_detector():
+    """Создает WeChat-детектор (с моделями, если они указаны)"""
+    if QR_WECHAT_MODEL_DIR:
+        return cv2.wechat_qrcode_WeChatQRCode(
+            os.path.join(QR_WECHAT_MODEL_DIR, 'detect.prototxt'),
+            os.path.join(QR_WECHAT_MODEL_DIR, 'detect.caffemodel'),
+            os.path.join(QR_WECHAT_MODEL_DIR, 'sr.prototxt'),
+            os.path.join(QR_WECHAT_MODEL_DIR, 'sr.caffemodel')
+        )
+    return cv2.wechat_qrcode_WeChatQRCode()
+
+
+def decode_opencv(img):
+    """Классический cv2.QRCodeDetector"""
+    detector = _get_detector('opencv', cv2.QRCodeDetector)
+    data, bbox, _ = detector.detectAndDecode(img)
+    return data or None
+
+
+def decode_aruco(img):
+    """cv2.QRCodeDetectorAruco (OpenCV 4.8+)"""
+    detector = _get_detector('aruco', cv2.QRCodeDetectorAruco)
+    data, bbox, _ = detector.detectAndDecode(img)
+    return data or None
+
+
+def decode_wechat(img):
+    """cv2.wechat_qrcode_WeChatQRCode (opencv-contrib)"""
+    detector = _get_detector('wechat', _create_wechat_detector)
+    results, points = detector.detectAndDecode(img)
+    for data in results:
+        if data:
+            return data
+    return None
+
+
+def decode_pyzbar(img):
+    """pyzbar / libzbar"""
+    for symbol in pyzbar.decode(_to_gray(img), symbols=[pyzbar.ZBarSymbol.QRCODE]):
+        data = symbol.data.decode('utf-8', errors='ignore')
+        if data:
+            return data
+    return None
+
+
+def _unique(values):
+    """Убирает пустые значения и повторы, сохраняя порядок"""
+    seen = []
+    for value in values:
+        if value and value not in seen:
+            seen.append(value)
+    return seen
+
+
+def decode_opencv_multi(img):
+    """Все QR-коды на кадре через cv2.QRCodeDetector.detectAndDecodeMulti"""
+    detector = _get_detector('opencv', cv2.QRCodeDetector)
+    ok, decoded, points, _ = detector.detectAndDecodeMulti(img)
+    return _unique(decoded) if ok else []
+
+
+def decode_aruco_multi(img):
+    """Все QR-коды на кадре через QRCodeDetectorAruco"""
+    detector = _get_detector('aruco', cv2.QRCodeDetectorAruco)
+    ok, decoded, points, _ = detector.detectAndDecodeMulti(img)
+    return _unique(decoded) if ok else []
+
+
+def decode_wechat_multi(img):
+    """Все QR-коды на кадре через WeChatQRCode"""
+    detector = _get_detector('wechat', _create_wechat_detector)
+    results, points = detector.detectAndDecode(img)
+    return _unique(results)
+
+
+def decode_pyzbar_multi(img):
+    """Все QR-коды на кадре через pyzbar"""
+    symbols = pyzbar.decode(_to_gray(img), symbols=[pyzbar.ZBarSymbol.QRCODE])
+    return _unique(symbol.data.decode('utf-8', errors='ignore') for symbol in symbols)
+
+
+DECODER_BACKENDS = {
+    'opencv': {
+        'title': 'OpenCV QRCodeDetector',
+        'is_available': lambda: hasattr(cv2, 'QRCodeDetector'),
+        'decode': decode_opencv,
+        'decode_multi': decode_opencv_multi,
+    },
+    'aruco': {
+        'title': 'OpenCV QRCodeDetectorAruco',
+        'is_available': lambda: hasattr(cv2, 'QRCodeDetectorAruco'),
+        'decode': decode_aruco,
+        'decode_multi': decode_aruco_multi,
+    },
+    'wechat': {
+        'title': 'OpenCV WeChatQRCode',
+        'is_available': lambda: hasattr(cv2, 'wechat_qrcode_WeChatQRCode'),
+        'decode': decode_wechat,
+        'decode_multi': decode_wechat_multi,
+    },
+    'pyzbar': {
+        'title': 'pyzbar (libzbar)',
+        'is_available': lambda: pyzbar is not None,
+        'decode': decode_pyzbar,
+        'decode_multi': decode_pyzbar_multi,
+    },
+}
+
+
+def get_available_backends():
+    """Список имен движков, доступных в текущей сборке"""
+    return [name for name, backend in DECODER_BACKENDS.items() if backend['is_available']()]
+
+
+def get_decoder_chain(spec=None):
+    """Разбирает цепочку движков из настроек, пропуская недоступные"""
+    if spec is None:
+        spec = QR_DECODER_BACKENDS
+
+    chain = []
+    for name in spec.split(','):
+        name = name.strip().lower()
+        if not name or name in chain:
+            continue
+        if name not in DECODER_BACKENDS:
+            print(f"⚠️ Неизвестный движок QR: {name}")
+            continue
+        if not DECODER_BACKENDS[name]['is_available']():
+            print(f"⚠️ Движок QR недоступен: {name}")
+            continue
+        chain.append(name)
+
+    return chain
+
+
+def decode_with_backend(name, img):
+    """Один проход выбранного движка по изображению"""
+    try:
+        return DECODER_BACKENDS[name]['decode'](img)
+    except Exception as e:
+        print(f"❌ Ошибка движка {name}: {e}")
+        return None
+
+
+def decode_multi_with_backend(name, img):
+    """Один проход выбранного движка, возвращает все найденные коды"""
+    try:
+        return DECODER_BACKENDS[name]['decode_multi'](img)
+    except Exception as e:
+        print(f"❌ Ошибка движка {name} (несколько кодов): {e}")
+        return []
+
+
+# ========== БЮДЖЕТ ВРЕМЕНИ ==========
+def make_deadline(budget_ms=None):
+    """Момент (time.monotonic), к которому сканирование должно закончиться"""
+    if budget_ms is None:
+        budget_ms = QR_SCAN_TIME_BUDGET_MS
+    if budget_ms <= 0:
+        return None
+    return time.monotonic() + budget_ms / 1000
+
+
+def time_left(deadline):
+    """Есть ли еще время до дедлайна (None - без ограничения)"""
+    return deadline is None or time.monotonic() < deadline
+
+
+# ========== ФУНКЦИИ ДЛЯ СКАНИРОВАНИЯ QR-КОДОВ ==========
+def decode_qr_code_from_photo(file_path, deadline=None, inverted=True):
+    """УЛУЧШЕННАЯ функция сканирования QR-кодов"""
+    frame = _read_frame(file_path)
+    if frame is None:
+        return None
+    return _decode_variants(frame, deadline, inverted)
+
+
+def _decode_variants(frame, deadline=None, inverted=True):
+    """7 фильтров классического детектора с голосованием по найденным данным"""
+    try:
+        img = frame.scaled
+        gray = frame.scaled_gray
+        qr_detector = _get_detector('opencv', cv2.QRCodeDetector)
+
+        # Фильтры считаются только когда до них дошла очередь
+        processing_methods = [
+            ("Оригинал", lambda: img),
+            ("Черно-белое", lambda: gray),
+            ("Повышенная яркость", lambda: cv2.convertScaleAbs(img, alpha=1.5, beta=40)),
+            ("Высокий контраст", lambda: cv2.convertScaleAbs(img, alpha=2.0, beta=0)),
+            ("Размытие + резкость", lambda: cv2.GaussianBlur(img, (5, 5), 0)),
+            ("Медианный фильтр", lambda: cv2.medianBlur(img, 3)),
+            ("Бинаризация", lambda: cv2.adaptiveThreshold(
+                gray,
+                255,
+                cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                cv2.THRESH_BINARY, 11, 2
+            )),
+        ]
+
+        found_data = []
+
+        for method_name, build in processing_methods:
+            # Время вышло - голосуем по тому, что уже нашли
+            if not time_left(deadline):
+                break
+            try:
+                data, bbox, _ = qr_detector.detectAndDecode(build())
+                if data and len(data) > 0:
+                    found_data.append((method_name, data))
+            except:
+                pass
+
+        if found_data:
+            data_counts = {}
+            for _, data in found_data:
+                data_counts[data] = data_counts.get(data, 0) + 1
+
+            most_common_data = max(data_counts.items(), key=lambda x: x[1])
+            return most_common_data[0]
+
+        if not inverted or not time_left(deadline):
+            return None
+
+        try:
+            inverted_img = cv2.bitwise_not(img)
+            data, bbox, _ = qr_detector.detectAndDecode(inverted_img)
+            if data and len(data) > 0:
+                return data
+        except:
+            pass
+
+        return None
+
+    except Exception as e:
+        print(f"❌ Ошибка сканирования: {e}")
+        return None
+
+
+# Ядро, которым PIL ImageEnhance.Sharpness сглаживает изображение
+_SMOOTH_KERNEL = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], np.float32) / 13
+
+
+def _contrast(gray, factor, dst):
+    """Аналог ImageEnhance.Contrast: растягивает яркость относительно среднего"""
+    mean = int(cv2.mean(gray)[0] + 0.5)
+    # addWeighted обрезает результат до 0..255, как PIL (convertScaleAbs отражал бы отрицательные)
+    return cv2.addWeighted(gray, factor, gray, 0, mean * (1 - factor), dst=dst)
+
+
+def _sharpness(gray, factor, dst, smooth):
+    """Аналог ImageEnhance.Sharpness: смешивает кадр со сглаженной копией"""
+    cv2.filter2D(gray, -1, _SMOOTH_KERNEL, dst=smooth, borderType=cv2.BORDER_REPLICATE)
+    # PIL не сглаживает крайние пиксели
+    smooth[0, :], smooth[-1, :] = gray[0, :], gray[-1, :]
+    smooth[:, 0], smooth[:, -1] = gray[:, 0], gray[:, -1]
+    return cv2.addWeighted(gray, factor, smooth, 1 - factor, 0, dst=dst)
+
+
+def _autocontrast(gray, cutoff, dst):
+    """Аналог ImageOps.autocontrast: растягивает гистограмму, отбрасывая cutoff% с краев"""
+    hist = np.bincount(gray.ravel(), minlength=256).cumsum()
+    threshold = hist[-1] * cutoff / 100
+    low = int(np.searchsorted(hist, threshold, side='right'))
+    high = int(np.searchsorted(hist, hist[-1] - threshold, side='left'))
+    if high <= low:
+        np.copyto(dst, gray)
+        return dst
+
+    # Таблица как в PIL: отбрасывание дробной части и обрезка до 0..255
+    scale = 255.0 / (high - low)
+    lut = np.clip((np.arange(256) * scale - low * scale).astype(np.int32), 0, 255).astype(np.uint8)
+    return cv2.LUT(gray, lut, dst=dst)
+
+
+def _upscale(gray):
+    """Увеличивает кадр в 2 раза (LANCZOS)"""
+    return cv2.resize(gray, None, fx=2, fy=2, interpolation=cv2.INTER_LANCZOS4)
+
+
+def _scale_small(img):
+    """Мелкие кадры увеличиваются (LANCZOS, не меньше 600 px), остальные - как есть"""
+    height, width = img.shape[:2]
+    if width < 300 or height < 300:
+        return cv2.resize(img, (max(600, width * 3), max(600, height * 3)),
+                          interpolation=cv2.INTER_LANCZOS4)
+    return img
+
+
+class _Frame:
+    """Кадр, прочитанный один раз: этапы фильтров берут из него готовые варианты"""
+
+    def __init__(self, img):
+        self.img = img
+
+    @cached_property
+    def gray(self):
+        return cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY)
+
+    @cached_property
+    def scaled(self):
+        return _scale_small(self.img)
+
+    @cached_property
+    def scaled_gray(self):
+        return cv2.cvtColor(self.scaled, cv2.COLOR_BGR2GRAY)
+
+
+def _read_frame(file_path):
+    img = cv2.imread(file_path, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    return _Frame(img)
+
+
+def _combined_pass(gray, qr_detector, deadline=None):
+    """Итоговый проход: увеличение 2x + автоконтраст + резкость"""
+    # Кадр 2x тяжелый: остаток времени проверяется перед каждым шагом
+    combined_img = _upscale(gray)
+    if not time_left(deadline):
+        return None
+    combined_img = _autocontrast(combined_img, 5, combined_img)
+    if not time_left(deadline):
+        return None
+    combined_img = _sharpness(combined_img, 3.0, np.empty_like(combined_img),
+                              np.empty_like(combined_img))
+    if not time_left(deadline):
+        return None
+
+    try:
+        data, bbox, _ = qr_detector.detectAndDecode(combined_img)
+        if data and len(data) > 0:
+            return data
+    except:
+        pass
+
+    return None
+
+
+def _decode_inverted(frame, deadline=None):
+    """Отдельный этап: инверсия цветов (светлый код на темном фоне)"""
+    return decode_with_backend('opencv', cv2.bitwise_not(frame.scaled_gray))
+
+
+def _decode_combined(frame, deadline=None):
+    """Отдельный этап: итоговый проход 2x LANCZOS с автоконтрастом и резкостью"""
+    return _combined_pass(frame.gray, _get_detector('opencv', cv2.QRCodeDetector), deadline)
+
+
+def enhanced_qr_decode(file_path, deadline=None, combined=True):
+    """УЛУЧШЕННАЯ функция сканирования QR-кодов с дополнительными методами"""
+    frame = _read_frame(file_path)
+    if frame is None:
+        return None
+    return _decode_enhanced(frame, deadline, combined)
+
+
+def _decode_enhanced(frame, deadline=None, combined=True):
+    """Контраст, резкость, инверсия, увеличение и автоконтраст по очереди"""
+    try:
+        # Все варианты строятся из одного кадра в оттенках серого
+        gray = frame.gray
+        work = np.empty_like(gray)
+        smooth = np.empty_like(gray)
+
+        # Варианты считаются по очереди в общий буфер: если код найден рано,
+        # остальные не вычисляются вовсе
+        methods = [
+            ("Высокий контраст", lambda: _contrast(gray, 2.0, work)),
+            ("Высокая резкость", lambda: _sharpness(gray, 3.0, work, smooth)),
+            ("Черно-белый контраст", lambda: _contrast(gray, 3.0, work)),
+            ("Инверсия цветов", lambda: cv2.bitwise_not(gray, dst=work)),
+            ("Увеличенный размер", lambda: _upscale(gray)),
+            ("Автоконтраст", lambda: _autocontrast(gray, 2, work)),
+        ]
+
+        qr_detector = _get_detector('opencv', cv2.QRCodeDetector)
+
+        for method_name, build in methods:
+            if not time_left(deadline):
+                return None
+            try:
+                data, bbox, _ = qr_detector.detectAndDecode(build())
+                if data and len(data) > 0:
+                    return data
+
+            except:
+                continue
+
+        if not combined or not time_left(deadline):
+            return None
+
+        return _combined_pass(gray, qr_detector, deadline)
+
+    except Exception as e:
+        print(f"❌ Ошибка в улучшенном сканировании: {e}")
+        return None
+
+
+# Этап получает кадр, прочитанный один раз, и дедлайн
+FILTER_STAGES = {
+    'variants': lambda frame, deadline: _decode_variants(frame, deadline, inverted=False),
+    'inverted': _decode_inverted,
+    'enhanced': lambda frame, deadline: _decode_enhanced(frame, deadline, combined=False),
+    'combined': _decode_combined,
+}
+
+
+def get_filter_stages(spec=None):
+    """Разбирает цепочку этапов перебора фильтров из настроек"""
+    if spec is None:
+        spec = QR_FILTER_STAGES
+
+    stages = []
+    for name in spec.split(','):
+        name = name.strip().lower()
+        if not name or name in stages:
+            continue
+        if name not in FILTER_STAGES:
+            print(f"⚠️ Неизвестный этап сканирования: {name}")
+            continue
+        stages.append(name)
+
+    return stages
+
+
+def decode_with_filters(file_path, deadline=None, stages=None):
+    """Медленный путь: этапы перебора фильтров, пока не кончится время"""
+    frame = _read_frame(file_path)
+    if frame is None:
+        return None
+    return _filter_pass(frame, deadline, stages)
+
+
+def _filter_pass(frame, deadline=None, stages=None):
+    if stages is None:
+        stages = get_filter_stages()
+
+    for stage in stages:
+        if not time_left(deadline):
+            break
+        qr_data = FILTER_STAGES[stage](frame, deadline)
+        if qr_data:
+            return qr_data
+
+    return None
+
+
+def _backend_pass(img, chain, decode, deadline):
+    """Движки по цепочке на исходном кадре; первый запускается в любом случае"""
+    if not chain:
+        return None
+
+    for index, name in enumerate(chain):
+        if index and not time_left(deadline):
+            break
+        result = decode(name, img)
+        if result:
+            return result
+
+    return None
+
+
+def decode_qr_payload(file_path, chain=None, filters=None, deadline=None):
+    """Сканирует фото: движки по цепочке на исходном кадре, затем перебор фильтров"""
+    if chain is None:
+        chain = get_decoder_chain()
+    if filters is None:
+        filters = QR_FILTER_FALLBACK
+
+    # Файл читается один раз: тот же кадр идет и движкам, и фильтрам
+    frame = _read_frame(file_path)
+    if frame is None:
+        return None
+
+    data = _backend_pass(frame.img, chain, decode_with_backend, deadline)
+    if data:
+        return data
+
+    if not filters:
+        return None
+
+    return _filter_pass(frame, deadline)
+
+
+def decode_qr_payloads(file_path, chain=None, filters=None, deadline=None):
+    """Ищет все QR-коды на фото (групповой режим)"""
+    if chain is None:
+        chain = get_decoder_chain()
+    if filters is None:
+        filters = QR_FILTER_FALLBACK
+
+    frame = _read_frame(file_path)
+    if frame is None:
+        return []
+
+    payloads = _backend_pass(frame.img, chain, decode_multi_with_backend, deadline)
+    if payloads:
+        return payloads
+
+    # Ни один движок ничего не нашел - пробуем найти хотя бы один код фильтрами
+    if not filters:
+        return []
+
+    qr_data = _filter_pass(frame, deadline)
+    return [qr_data] if qr_data else []
+
+
+def decode_qr_video(file_path, frame_stride=5, time_budget_ms=8000, chain=None):
+    """Ищет QR-коды в видео: каждый N-й кадр, пока не закончится бюджет времени"""
+    if chain is None:
+        chain = get_decoder_chain() or ['opencv']
+
+    deadline = time.monotonic() + time_budget_ms / 1000
+    frame_stride = max(1, frame_stride)
+    payloads = []
+
+    capture = cv2.VideoCapture(file_path)
+    try:
+        frame_index = 0
+        while time.monotonic() < deadline:
+            # Пропущенные кадры только переходятся, без декодирования в массив
+            if frame_index % frame_stride:
+                if not capture.grab():
+                    break
+                frame_index += 1
+                continue
+
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frame_index += 1
+
+            for name in chain:
+                found = decode_multi_with_backend(name, frame)
+                if found:
+                    payloads.extend(data for data in found if data not in payloads)
+                    break
+    finally:
+        capture.release()
+
+    return payloads
@@ -0,0 +1,149 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+
+# ========== НАСТРОЙКИ ХРАНИЛИЩА СОСТОЯНИЙ ==========
+# sqlite - состояния диалогов переживают перезапуск; memory - только в памяти процесса
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'sqlite')
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', 'state.db')
+
+# Сколько секунд ждать следующего шага, прежде чем забыть незаконченный диалог
+STATE_TTL = int(os.getenv('STATE_TTL', '3600'))
+
+# Просроченные записи удаляются раз в столько записей
+_PURGE_EVERY = 100
+
+
+def _dump(data):
+    """Компактная запись данных шага"""
+    return json.dumps(data or {}, ensure_ascii=False, separators=(',', ':'))
+
+
+# ========== ХРАНИЛИЩЕ В ПАМЯТИ ==========
+class MemoryStateStore:
+    """Состояния диалогов в словаре: {ключ: (шаг, данные, истекает)}"""
+
+    def __init__(self, ttl=STATE_TTL):
+        self.ttl = ttl
+        self._states = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key):
+        """Текущее состояние {'step', 'data'} или None"""
+        with self._lock:
+            state = self._states.get(key)
+            if not state:
+                return None
+            step, data, expires_at = state
+            if expires_at <= time.time():
+                del self._states[key]
+                return None
+            return {'step': step, 'data': json.loads(data)}
+
+    def set(self, key, step, data=None):
+        """Сохраняет шаг диалога и продлевает срок жизни"""
+        with self._lock:
+            self._states[key] = (step, _dump(data), time.time() + self.ttl)
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                self._purge()
+
+    def pop(self, key):
+        """Забирает состояние (шаг выполняется один раз)"""
+        state = self.get(key)
+        self.delete(key)
+        return state
+
+    def delete(self, key):
+        with self._lock:
+            self._states.pop(key, None)
+
+    def _purge(self):
+        now = time.time()
+        for key in [key for key, state in self._states.items() if state[2] <= now]:
+            del self._states[key]
+
+
+# ========== ХРАНИЛИЩЕ В SQLITE ==========
+class SQLiteStateStore:
+    """Состояния диалогов в отдельной базе: одна строка на чат, данные в JSON"""
+
+    def __init__(self, path=STATE_DB_PATH, ttl=STATE_TTL):
+        self.ttl = ttl
+        # База состояний общая для всех процессов ботов (см. launcher.py)
+        self._conn = sqlite3.connect(path, isolation_level=None, timeout=10, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS states (
+                key TEXT PRIMARY KEY,
+                step TEXT NOT NULL,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_states_expires ON states (expires_at)')
+
+        with self._lock:
+            self._purge()
+
+    def get(self, key):
+        """Текущее состояние {'step', 'data'} или None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT step, data FROM states WHERE key = ? AND expires_at > ?',
+                (key, time.time())
+            ).fetchone()
+        if not row:
+            return None
+        return {'step': row[0], 'data': json.loads(row[1])}
+
+    def set(self, key, step, data=None):
+        """Сохраняет шаг диалога и продлевает срок жизни"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO states (key, step, data, expires_at) VALUES (?, ?, ?, ?)',
+                (key, step, _dump(data), time.time() + self.ttl)
+            )
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                self._purge()
+
+    def pop(self, key):
+        """Забирает состояние (шаг выполняется один раз)"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT step, data FROM states WHERE key = ? AND expires_at > ?',
+                (key, time.time())
+            ).fetchone()
+            self._conn.execute('DELETE FROM states WHERE key = ?', (key,))
+        if not row:
+            return None
+        return {'step': row[0], 'data': json.loads(row[1])}
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute('DELETE FROM states WHERE key = ?', (key,))
+
+    def _purge(self):
+        self._conn.execute('DELETE FROM states WHERE expires_at <= ?', (time.time(),))
+
+
+STATE_BACKENDS = {
+    'memory': MemoryStateStore,
+    'sqlite': SQLiteStateStore,
+}
+
+
+def create_state_store(backend=None):
+    """Хранилище состояний по настройке STATE_BACKEND"""
+    backend = (backend or STATE_BACKEND).strip().lower()
+    if backend not in STATE_BACKENDS:
+        print(f"⚠️ Неизвестное хранилище состояний '{backend}', используется sqlite")
+        backend = 'sqlite'
+    return STATE_BACKENDS[backend]()